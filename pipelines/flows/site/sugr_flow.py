@@ -8,19 +8,35 @@ from metaflow import (
     step,  # pyright: ignore [reportPrivateImportUsage]
     trigger_on_finish,  # pyright: ignore [reportAttributeAccessIssue]
 )
+from utilities.tracing import span, traced
 
 
 @conda_base(python=">=3.12,<3.13", packages={"polars": "==1.2.1", "pyarrow": "17.0.0"})
 @trigger_on_finish(flows=["SugrIslandsFlow", "SugrGamesFlow"])
 class SiteSugrFlow(FlowSpec):
     param_output = Parameter("output", required=True, type=str)
+    param_complexity_weight = Parameter("complexity-weight", default=1.2)
+    param_very_high = Parameter("very-high", default=42)
+    param_difficulty_quantiles = Parameter("difficulty-quantiles", default=5)
+    param_complexity_quantiles = Parameter("complexity-quantiles", default=5)
+    # MiB each task can use, 0 streams everything without a budget
+    param_memory_budget = Parameter("memory-budget", default=0)
+    # Tasks running at once, should match the run's --max-workers
+    param_concurrency = Parameter("concurrency", default=16)
+    # Partitions packaged by each task, every task pays for its startup
+    param_partitions_per_task = Parameter("partitions-per-task", default=16)
+    # Captures the plan and profile of every plan packaged or collected
+    param_profile = Parameter("profile", default=False)
+    # lz4 or zstd, the site's Arrow JS can't read compressed files as of 17.0.0
+    param_compression = Parameter("compression", default="")
 
     @step
+    @traced
     def start(self) -> None:
         import os
-        import shutil
         from pathlib import Path
 
+        from utilities.memory_budget import MemoryBudget
         from utilities.working_dir import WorkingDirectory
 
         temp = WorkingDirectory.for_metaflow_run(
@@ -28,40 +44,78 @@ class SiteSugrFlow(FlowSpec):
             typing.cast(int, current.run_id),
         )
 
+        # Partitions are only rewritten when they change, see package
         self.output = Path(typing.cast(str, self.param_output))
-        if self.output.exists():
-            shutil.rmtree(self.output)
+        self.output.mkdir(mode=0o755, parents=True, exist_ok=True)
 
+        self.profiles = temp.push_segment("profiles") if self.param_profile else None
         self.ephemeral = temp.push_segment("ephemeral")
         os.environ["POLARS_TEMP_DIR"] = str(
             self.ephemeral.push_segment(
                 "polars",
             ),
         )
+        self.budget = MemoryBudget.from_mib(
+            typing.cast(int, self.param_memory_budget),
+            os.environ["POLARS_TEMP_DIR"],
+        )
 
         self.next(self.copy_inputs)
 
     @step
+    @traced
     def copy_inputs(self) -> None:
-        import pyarrow.feather as pf
+        import json
 
         if typing.TYPE_CHECKING:
             from utilities.hive_dataset import HiveDataset
 
+        from transformations.site.lookups import adversary_lookup, spirit_lookup
+        from transformations.site.package import (
+            content_address,
+            encode,
+            replacing,
+            write_feather,
+        )
+
+        inputs: dict[str, HiveDataset] = {}
+        # Published under their content-addressed names once the site's packaged
+        self.published_inputs: dict[str, str] = {}
         for infile in ["spirits", "adversaries"]:
             ds: HiveDataset = getattr(
                 current.trigger["SugrIslandsFlow"].data,  # pyright: ignore [reportAttributeAccessIssue]
                 f"input_{infile}_ds",
             )
-            pf.write_feather(
-                ds.read().collect(streaming=True).to_arrow(),
+            inputs[infile] = ds
+            write_feather(
+                encode(ds.read().collect(streaming=True).to_arrow()),
                 self.output / f"{infile}.feather",
-                compression="uncompressed",
+                typing.cast(str, self.param_compression) or None,
             )
+            self.published_inputs[f"{infile}.feather"] = content_address(
+                self.output / f"{infile}.feather",
+            ).name
+
+        # Keyed lookups so the site doesn't scan the inputs for every game
+        adversaries = inputs["adversaries"].read()
+        lookups = {
+            "adversaries": adversary_lookup(adversaries),
+            "spirits": spirit_lookup(inputs["spirits"].read(), adversaries),
+        }
+        for name, lookup in lookups.items():
+            with (
+                replacing(self.output / f"{name}.json") as staged,
+                staged.open("w", encoding="utf-8") as f,
+            ):
+                json.dump(lookup, f, separators=(",", ":"))
+            self.published_inputs[f"{name}.json"] = content_address(
+                self.output / f"{name}.json",
+            ).name
 
         self.next(self.branch_flowtypes)
 
     @step
+    @traced
     def branch_flowtypes(self) -> None:
         if typing.TYPE_CHECKING:
             from utilities.hive_dataset import HiveDataset
@@ -69,100 +123,333 @@ class SiteSugrFlow(FlowSpec):
         self.islands_ds: HiveDataset = current.trigger[  # pyright: ignore [reportAttributeAccessIssue]
             "SugrIslandsFlow"
         ].data.islands_ds
-        self.games_ds: HiveDataset = current.trigger[  # pyright: ignore [reportAttributeAccessIssue]
-            "SugrGamesFlow"
-        ].data.games_ds
+        games = current.trigger["SugrGamesFlow"].data  # pyright: ignore [reportAttributeAccessIssue]
+        self.games_ds: HiveDataset = games.games_ds
+        self.games_normalized: tuple[HiveDataset, HiveDataset, HiveDataset] | None = (
+            (
+                games.games_normalized_ds,
+                games.games_teams_ds,
+                games.games_levels_ds,
+            )
+            if "games_normalized" in games and games.games_normalized
+            else None
+        )
+        # The adversaries and combinations late bound games are created from
+        self.components: tuple[HiveDataset, HiveDataset, HiveDataset] | None = (
+            (games.component_scores_ds, games.adversaries_ds, games.combinations_ds)
+            if "component_scores_ds" in games and games.component_scores_ds is not None
+            else None
+        )
+        self.fixed_point = "scoring" in games and games.scoring.fixed_point
 
         self.next(self.fanout_islands, self.fanout_games)
 
     @step
+    @traced
     def fanout_islands(self) -> None:
+        from utilities.threads import allocate_threads, distribute
+
         self.partitions = self.islands_ds.partitions()
-        self.next(self.package_islands, foreach="partitions")
+        self.sizes = [self.islands_ds.size(**p) for p in self.partitions]
+        # Sampling and packaging take time with the rows of a partition
+        rows = [self.islands_ds.rows(**p) for p in self.partitions]
+        self.tasks = distribute(
+            rows,
+            typing.cast(int, self.param_partitions_per_task),
+        )
+        self.threads = allocate_threads(
+            [sum(rows[i] for i in t) for t in self.tasks],
+            typing.cast(int, self.param_concurrency),
+        )
+        self.next(self.package_islands, foreach="tasks")
 
     @step
+    @traced
     def package_islands(self) -> None:
+        from utilities.threads import use_threads
+
+        threads = self.threads[typing.cast(int, self.index)]
+        use_threads(threads, "package_islands")
+
         from pathlib import Path
 
-        import pyarrow.feather as pf
+        from utilities.profiling import capture
 
-        from transformations.site.package import batch, drop_nulls, sample
+        from transformations.site.package import drop_nulls, package, sample
 
-        partition = typing.cast(dict[str, typing.Any], self.input)
-        print(partition)
-        path = (
-            self.output
-            / "islands"
-            / Path(*[f"{k}={v}" for (k, v) in partition.items()])
-        )
-        path.mkdir(mode=0o755, parents=True, exist_ok=True)
+        # Parquet files are roughly a quarter of their size in memory
+        parquet_ratio = 4
 
-        end = 0
-        for (start, e), part in batch(
-            sample(drop_nulls(self.islands_ds.read(**partition))),
-        ):
-            pf.write_feather(
-                part.collect(streaming=True).to_arrow(),
-                path / f"{start}.feather",
-                compression="uncompressed",
+        def _package(i: int) -> tuple[str, str]:
+            partition = self.partitions[i]
+            print(partition)
+            path = (
+                self.output
+                / "islands"
+                / Path(*[f"{k}={v}" for (k, v) in partition.items()])
             )
-            end = e
+            path.mkdir(mode=0o755, parents=True, exist_ok=True)
 
-        print(partition, f": {end} total rows")
+            islands = sample(
+                drop_nulls(
+                    self.islands_ds.read(**partition),
+                    self.islands_ds.null_columns(**partition),
+                ),
+            )
+            capture(islands, "package")
+
+            with span("package", "transformation", **partition) as args:
+                packaged = package(
+                    islands,
+                    path,
+                    compression=typing.cast(str, self.param_compression) or None,
+                )
+                args.update(
+                    rows=packaged.rows,
+                    plain_bytes=packaged.plain_bytes,
+                    bytes=packaged.written_bytes,
+                )
+
+            print(partition, packaged)
+            return (path.relative_to(self.output).as_posix(), packaged.manifest)
+
+        indices = typing.cast(list[int], self.input)
+        self.published = dict(
+            self.budget.map(
+                _package,
+                indices,
+                [self.sizes[i] * parquet_ratio for i in indices],
+                threads,
+            ),
+        )
+        self.peak_rss = self.budget.record("package_islands")
 
         self.next(self.collect_islands)
 
     @step
+    @traced
     def collect_islands(self, inputs: typing.Any) -> None:
-        self.merge_artifacts(inputs, include=["ephemeral"])
+        self.merge_artifacts(
+            inputs,
+            include=["ephemeral", "output", "published_inputs"],
+        )
+        self.published_islands = {
+            k: v for i in inputs for (k, v) in i.published.items()
+        }
         self.next(self.join_flowtypes)
 
     @step
+    @traced
     def fanout_games(self) -> None:
-        self.partitions = self.games_ds.partitions()
-        self.next(self.package_games, foreach="partitions")
+        from utilities.threads import allocate_threads, distribute
+
+        from transformations.sugr.games import (
+            Scoring,
+            bucket_games,
+            normalized_expansions,
+        )
+
+        if self.components is not None:
+            (scores_ds, _, combinations_ds) = self.components
+            self.scoring = Scoring(
+                complexity_weight=typing.cast(float, self.param_complexity_weight),
+                very_high=typing.cast(int, self.param_very_high),
+                difficulty_quantiles=typing.cast(int, self.param_difficulty_quantiles),
+                complexity_quantiles=typing.cast(int, self.param_complexity_quantiles),
+                fixed_point=self.fixed_point,
+            )
+            # The games flow counted the scores of each partition's components
+            self.buckets = bucket_games(scores_ds.read(), self.scoring)
+            self.partitions = [
+                {**p, "Difficulty": b.difficulty, "Complexity": b.complexity}
+                for p in scores_ds.partitions()
+                for b in self.buckets[p["Expansion"]]
+            ]
+            # Every bucket filters all the components of its partition
+            sources = [
+                (combinations_ds, {k: p[k] for k in ["Expansion", "Players"]})
+                for p in self.partitions
+            ]
+        elif self.games_normalized is None:
+            self.partitions = self.games_ds.partitions()
+            sources = [(self.games_ds, p) for p in self.partitions]
+        else:
+            (normalized_ds, _, _) = self.games_normalized
+            self.partitions = [
+                {"Expansion": e, **p}
+                for p in normalized_ds.partitions()
+                for e in normalized_expansions(normalized_ds.read(**p))
+            ]
+            sources = [
+                (normalized_ds, {k: v for (k, v) in p.items() if k != "Expansion"})
+                for p in self.partitions
+            ]
+
+        self.sizes = [ds.size(**keys) for (ds, keys) in sources]
+        # Sampling and packaging take time with the rows read for a partition
+        rows = [ds.rows(**keys) for (ds, keys) in sources]
+        self.tasks = distribute(
+            rows,
+            typing.cast(int, self.param_partitions_per_task),
+        )
+        self.threads = allocate_threads(
+            [sum(rows[i] for i in t) for t in self.tasks],
+            typing.cast(int, self.param_concurrency),
+        )
+        self.next(self.package_games, foreach="tasks")
 
     @step
+    @traced
     def package_games(self) -> None:
-        from pathlib import Path
+        from utilities.threads import use_threads
 
-        import pyarrow.feather as pf
+        threads = self.threads[typing.cast(int, self.index)]
+        use_threads(threads, "package_games")
 
-        from transformations.site.package import batch, drop_nulls, sample
+        from pathlib import Path
+
+        from utilities.profiling import capture
 
-        partition = typing.cast(dict[str, typing.Any], self.input)
-        print(partition)
-        path = (
-            self.output / "games" / Path(*[f"{k}={v}" for (k, v) in partition.items()])
+        from transformations.site.package import drop_nulls, package, sample
+        from transformations.sugr.games import (
+            denormalize_games,
+            filter_components_by_bucket,
+            game_components,
         )
-        path.mkdir(mode=0o755, parents=True, exist_ok=True)
 
-        end = 0
-        for (start, e), part in batch(
-            sample(drop_nulls(self.games_ds.read(low_memory=True, **partition))),
-        ):
-            pf.write_feather(
-                part.collect(streaming=True).to_arrow(),
-                path / f"{start}.feather",
-                compression="uncompressed",
-            )
-            end = e
+        # Parquet files are roughly a quarter of their size in memory
+        parquet_ratio = 4
 
-        print(partition, f": {end} total rows")
+        def _package(i: int) -> tuple[str, str]:
+            partition = self.partitions[i]
+            print(partition)
+            path = (
+                self.output
+                / "games"
+                / Path(*[f"{k}={v}" for (k, v) in partition.items()])
+            )
+            path.mkdir(mode=0o755, parents=True, exist_ok=True)
+
+            memory = self.sizes[i] * parquet_ratio
+            # Games read straight from a partition have its null columns in its footers
+            nulls = None
+            if self.components is not None:
+                (_, adversaries_ds, combinations_ds) = self.components
+                keys = {k: partition[k] for k in ["Expansion", "Players"]}
+                (bucket,) = (
+                    b
+                    for b in self.buckets[partition["Expansion"]]
+                    if b.difficulty == partition["Difficulty"]
+                    and b.complexity == partition["Complexity"]
+                )
+                games = filter_components_by_bucket(
+                    bucket,
+                    game_components(
+                        adversaries_ds.read(Expansion=partition["Expansion"]),
+                        combinations_ds.read(
+                            low_memory=self.budget.low_memory(memory),
+                            **keys,
+                        ),
+                        use_expansion=False,
+                    ),
+                    partition["Expansion"],
+                    partition["Players"],
+                    self.scoring,
+                )
+            elif self.games_normalized is None:
+                games = self.games_ds.read(
+                    low_memory=self.budget.low_memory(memory),
+                    **partition,
+                )
+                nulls = self.games_ds.null_columns(**partition)
+            else:
+                (normalized_ds, teams_ds, levels_ds) = self.games_normalized
+                keys = {k: v for (k, v) in partition.items() if k != "Expansion"}
+                games = denormalize_games(
+                    normalized_ds.read(
+                        low_memory=self.budget.low_memory(memory),
+                        **keys,
+                    ),
+                    teams_ds.read(Players=partition["Players"]),
+                    levels_ds.read(),
+                    partition["Expansion"],
+                )
+
+            games = sample(drop_nulls(games, nulls))
+            capture(games, "package")
+
+            with span("package", "transformation", **partition) as args:
+                packaged = package(
+                    games,
+                    path,
+                    compression=typing.cast(str, self.param_compression) or None,
+                )
+                args.update(
+                    rows=packaged.rows,
+                    plain_bytes=packaged.plain_bytes,
+                    bytes=packaged.written_bytes,
+                )
+
+            print(partition, packaged)
+            return (path.relative_to(self.output).as_posix(), packaged.manifest)
+
+        indices = typing.cast(list[int], self.input)
+        self.published = dict(
+            self.budget.map(
+                _package,
+                indices,
+                [self.sizes[i] * parquet_ratio for i in indices],
+                threads,
+            ),
+        )
+        self.peak_rss = self.budget.record("package_games")
         self.next(self.collect_games)
 
     @step
+    @traced
     def collect_games(self, inputs: typing.Any) -> None:
-        self.merge_artifacts(inputs, include=["ephemeral"])
+        self.merge_artifacts(
+            inputs,
+            include=["ephemeral", "output", "published_inputs"],
+        )
+        self.published_games = {k: v for i in inputs for (k, v) in i.published.items()}
         self.next(self.join_flowtypes)
 
     @step
+    @traced
     def join_flowtypes(self, inputs: typing.Any) -> None:
-        self.merge_artifacts(inputs, include=["ephemeral"])
+        from transformations.site.package import publish
+
+        self.merge_artifacts(
+            inputs,
+            include=["ephemeral", "output", "published_inputs"],
+        )
+
+        # Only published once every partition is packaged, the files of the
+        # previous run are needed until then
+        with span("publish", "write") as args:
+            removed = publish(
+                self.output,
+                self.published_inputs,
+                {
+                    **inputs.collect_islands.published_islands,
+                    **inputs.collect_games.published_games,
+                },
+            )
+            args.update(removed=len(removed))
+
+        print(f"Published, {len(removed)} files removed")
         self.next(self.end)
 
     @step
+    @traced
     def end(self) -> None:
+        from utilities.tracing import timeline
+
+        self.timeline = timeline(
+            typing.cast(str, current.flow_name),
+            typing.cast(str, current.run_id),
+        )
         self.ephemeral.cleanup()
 
 
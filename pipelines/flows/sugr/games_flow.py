@@ -7,11 +7,27 @@ from metaflow import (
     current,  # pyright: ignore [reportPrivateImportUsage]
     step,  # pyright: ignore [reportPrivateImportUsage]
 )
-
-__OUTPUT_ARTIFACTS__ = ("ephemeral", "games_ds")
+from utilities.tracing import span, traced
+
+if typing.TYPE_CHECKING:
+    import polars as pl
+    from utilities.hive_dataset import HiveDataset
+
+    from transformations.sugr.games import Bucket
+
+__OUTPUT_ARTIFACTS__ = (
+    "ephemeral",
+    "games_ds",
+    "component_scores_ds",
+    "scoring",
+    "estimates",
+    "budget",
+    "profiles",
+)
 
 __DATASETS__ = (
     "input_expansions_ds",
+    "input_expansions_sliced_ds",
     "input_adversaries_ds",
     "input_escalations_ds",
     "input_spirits_ds",
@@ -28,17 +44,36 @@ class SugrGamesFlow(FlowSpec):
     param_keep = Parameter("keep", default=False)
     param_player_limit = Parameter("player-limit", default=6)
     param_subset = Parameter("subset", default=False)
+    param_all_players = Parameter("all-players", default=False)
+    param_lattice = Parameter("lattice", default=False)
+    param_normalize = Parameter("normalize", default=False)
+    param_factorize = Parameter("factorize", default=False)
+    param_late_binding = Parameter("late-binding", default=False)
+    param_fixed_point = Parameter("fixed-point", default=False)
+    # Estimated rows a combinations/bucket task handles before it is sharded
+    param_shard_size = Parameter("shard-size", default=25_000_000)
+    # MiB each task can use, 0 streams everything without a budget
+    param_memory_budget = Parameter("memory-budget", default=0)
+    # Tasks running at once, should match the run's --max-workers
+    param_concurrency = Parameter("concurrency", default=16)
+    # Captures the plan and profile of every plan written or collected
+    param_profile = Parameter("profile", default=False)
 
     @step
+    @traced
     def start(self) -> None:
         import os
         from pathlib import Path
 
         import polars as pl
         from utilities.hive_dataset import HiveDataset
+        from utilities.memory_budget import MemoryBudget
         from utilities.working_dir import WorkingDirectory
 
+        from transformations.sugr.games import Scoring
+
         input_dir = Path(typing.cast(str, self.param_input))
+        self.scoring = Scoring(fixed_point=typing.cast(bool, self.param_fixed_point))
 
         temp = WorkingDirectory.for_metaflow_run(
             "sugr-games",
@@ -52,6 +87,22 @@ class SugrGamesFlow(FlowSpec):
             Difficulty=pl.UInt8,  # type: ignore [argumentType]
             Complexity=pl.String,  # type: ignore [argumentType]
         )
+        self.profiles = (
+            temp.push_segment("results").push_segment("profiles")
+            if self.param_profile
+            else None
+        )
+        # Counts of each pair of adversary and team scores to bucket late bound games
+        self.component_scores_ds: HiveDataset | None = (
+            HiveDataset(
+                temp.push_segment("results").path,
+                "component_scores",
+                Expansion=pl.UInt8,  # type: ignore [argumentType]
+                Players=pl.UInt8,  # type: ignore [argumentType]
+            )
+            if self.param_late_binding
+            else None
+        )
 
         self.ephemeral = temp.push_segment("ephemeral")
         os.environ["POLARS_TEMP_DIR"] = str(
@@ -59,6 +110,10 @@ class SugrGamesFlow(FlowSpec):
                 "polars",
             ),
         )
+        self.budget = MemoryBudget.from_mib(
+            typing.cast(int, self.param_memory_budget),
+            os.environ["POLARS_TEMP_DIR"],
+        )
 
         self.source = temp.push_segment("source")
         self.input_expansions_ds = HiveDataset.from_tsv(
@@ -85,14 +140,33 @@ class SugrGamesFlow(FlowSpec):
         self.next(self.fanout_expansions)
 
     @step
+    @traced
     def fanout_expansions(self) -> None:
         import polars as pl
         from utilities.hive_dataset import HiveDataset
+        from utilities.threads import allocate_threads
 
-        from transformations.sugr.expansions import expansions_and_players
+        from transformations.sugr.estimates import estimate, estimate_games
+        from transformations.sugr.expansions import (
+            expansions_and_players,
+            slice_by_expansions,
+        )
 
+        # Set rather than Expansion, the inputs have their own Expansion bitmasks
+        self.input_expansions_sliced_ds = HiveDataset(
+            self.source.path,
+            "expansions_sliced",
+            Source=pl.String,  # type: ignore [argumentType]
+            Set=pl.UInt8,  # type: ignore [argumentType]
+        )
+        # Late bound games are created from the adversaries and combinations
+        components = (
+            self.games_ds.path().parent
+            if self.param_late_binding
+            else self.ephemeral.path
+        )
         self.adversaries_ds = HiveDataset(
-            self.ephemeral.path,
+            components,
             "adversaries",
             Expansion=pl.UInt8,  # type: ignore [argumentType]
         )
@@ -108,7 +182,7 @@ class SugrGamesFlow(FlowSpec):
             Matchup=pl.String,  # type: ignore [argumentType]
         )
         self.combinations_ds = HiveDataset(
-            self.ephemeral.path,
+            components,
             "combinations",
             Expansion=pl.UInt8,  # type: ignore [argumentType]
             Players=pl.UInt8,  # type: ignore [argumentType]
@@ -121,10 +195,59 @@ class SugrGamesFlow(FlowSpec):
             max_players=typing.cast(int, self.param_player_limit),
         )
 
+        self.estimates = estimate_games(
+            self.input_expansions_ds.read(),
+            self.input_adversaries_ds.read(),
+            self.input_escalations_ds.read(),
+            self.input_spirits_ds.read(),
+            subset=typing.cast(bool, self.param_subset),
+            max_players=typing.cast(int, self.param_player_limit),
+            scoring=self.scoring,
+        )
+        print(
+            self.estimates.group_by("Stage", maintain_order=True).agg(
+                pl.col("Rows", "Bytes").sum(),
+                pl.col("Memory").max(),
+            ),
+        )
+        self.threads = allocate_threads(
+            [
+                estimate(self.estimates, "matchups", Expansion=exp)[2]
+                for (exp, _) in self.expansions
+            ],
+            typing.cast(int, self.param_concurrency),
+        )
+
+        # Each expansion task only reads the rows valid for its expansions,
+        # cross joins aren't supported by sink_parquet as of 1.2.1
+        for source, ds, disjoint in [
+            ("spirits", self.input_spirits_ds, False),
+            ("adversaries", self.input_adversaries_ds, False),
+            ("escalations", self.input_escalations_ds, True),
+        ]:
+            self.input_expansions_sliced_ds.write(
+                slice_by_expansions(
+                    [exp for (exp, _) in self.expansions],
+                    ds.read(),
+                    disjoint=disjoint,
+                )
+                .collect(streaming=True)
+                .lazy(),
+                allow_empty=True,
+                Source=source,
+            )
+
         self.next(self.filter_by_expansion, foreach="expansions")
 
     @step
+    @traced
     def filter_by_expansion(self) -> None:
+        from utilities.threads import use_threads
+
+        use_threads(self.threads[typing.cast(int, self.index)], "filter_by_expansion")
+
+        import polars as pl
+
         from transformations.sugr.adversaries import adversaries_by_expansions
         from transformations.sugr.spirits import spirits_by_expansions
 
@@ -133,91 +256,269 @@ class SugrGamesFlow(FlowSpec):
             self.input,
         )
 
-        (adversaries, self.matchups) = adversaries_by_expansions(
-            self.expansion,
-            self.input_adversaries_ds.read(),
-            self.input_escalations_ds.read(),
-        )
-        self.adversaries_ds.write(adversaries, Expansion=self.expansion)
-
-        self.spirits_ds.write(
-            spirits_by_expansions(
-                self.expansion,
-                self.input_spirits_ds.read(),
-            ),
-            Expansion=self.expansion,
-        )
+        def _sliced(source: str, ds: "HiveDataset") -> pl.LazyFrame:
+            # Sets without any valid rows have no partition
+            if self.input_expansions_sliced_ds.rows(Source=source, Set=self.expansion):
+                return self.input_expansions_sliced_ds.read(
+                    Source=source,
+                    Set=self.expansion,
+                )
+            return ds.read().clear()
+
+        with span("adversaries_by_expansions", "transformation"):
+            (adversaries, self.matchups) = adversaries_by_expansions(
+                _sliced("adversaries", self.input_adversaries_ds),
+                _sliced("escalations", self.input_escalations_ds),
+            )
+            self.adversaries_ds.write(adversaries, Expansion=self.expansion)
 
-        self.next(self.fanout_matchups)
+        with span("spirits_by_expansions", "transformation"):
+            self.spirits_ds.write(
+                spirits_by_expansions(_sliced("spirits", self.input_spirits_ds)),
+                Expansion=self.expansion,
+            )
 
-    @step
-    def fanout_matchups(self) -> None:
-        self.next(self.calculate_matchups, foreach="matchups")
+        self.next(self.calculate_matchups)
 
     @step
+    @traced
     def calculate_matchups(self) -> None:
-        from transformations.sugr.spirits import calculate_matchups
+        from utilities.threads import use_threads
+
+        use_threads(self.threads[typing.cast(int, self.index)], "calculate_matchups")
+
+        from transformations.sugr.estimates import estimate
+        from transformations.sugr.spirits import calculate_all_matchups
+
+        (_, _, memory) = estimate(self.estimates, "matchups", Expansion=self.expansion)
+        # group_by isn't supported by sink_parquet as of 1.2.1
+        with span("calculate_all_matchups", "transformation"):
+            self.matchups_ds.write(
+                calculate_all_matchups(
+                    self.matchups,
+                    self.spirits_ds.read(Expansion=self.expansion),
+                )
+                .pipe(self.budget.collect, memory)
+                .lazy(),
+                Expansion=self.expansion,
+            )
 
-        self.matchup = typing.cast(str, self.input)
+        self.next(self.collect_expansions)
 
-        self.matchups_ds.write(
-            calculate_matchups(
-                self.matchup,
-                self.spirits_ds.read(Expansion=self.expansion),
-            ),
-            Expansion=self.expansion,
-            Matchup=self.matchup,
+    @step
+    @traced
+    def collect_expansions(self, inputs: typing.Any) -> None:
+        self.merge_artifacts(
+            inputs,
+            include=[*__OUTPUT_ARTIFACTS__, *__DATASETS__, "input_combinations"],
         )
-
-        self.next(self.fanout_players)
+        self.expansion_matchups = [
+            (inp.expansion, inp.players, inp.matchups) for inp in inputs
+        ]
+        self.next(self.fanout_combinations)
 
     @step
-    def fanout_players(self) -> None:
-        self.next(self.generate_combinations, foreach="players")
+    @traced
+    def fanout_combinations(self) -> None:
+        import polars as pl
+        from utilities.threads import allocate_threads
+
+        from transformations.sugr.estimates import estimate
+        from transformations.sugr.shards import shard_ranges
+
+        # Rows of the input combinations of each sharded player count
+        input_rows: dict[int, int] = {}
+        if self.param_lattice:
+            # Every expansion with the matchup is scored together
+            max_players: dict[str, int] = {}
+            for _, players, matchups in self.expansion_matchups:
+                for m in matchups:
+                    max_players[m] = max(max_players.get(m, 0), *players)
+
+            self.combination_groups = [
+                (None, m, list(range(1, pc + 1)), None)
+                for (m, pc) in max_players.items()
+            ]
+        elif self.param_all_players:
+            # All the player counts can share the work of the smaller teams
+            self.combination_groups = [
+                (exp, m, players, None)
+                for (exp, players, matchups) in self.expansion_matchups
+                for m in matchups
+            ]
+        else:
+            # Large player counts are split into ranges of the input combinations
+            # 1 player teams are the matchups themselves, their input isn't read
+            shards: dict[int, typing.Sequence[tuple[int, int] | None]] = {1: [None]}
+            for pc in {
+                pc for (_, players, _) in self.expansion_matchups for pc in players
+            } - {1}:
+                # Counted from the parquet footers without scanning
+                input_rows[pc] = (
+                    pl.scan_parquet(self.input_combinations[pc])
+                    .select(pl.len())
+                    .collect()
+                    .item()
+                )
+                shards[pc] = shard_ranges(
+                    input_rows[pc],
+                    input_rows[pc] * pc,
+                    typing.cast(int, self.param_shard_size),
+                )
+
+            self.combination_groups = [
+                (exp, m, [pc], shard)
+                for (exp, players, matchups) in self.expansion_matchups
+                for m in matchups
+                for pc in players
+                for shard in shards[pc]
+            ]
+
+        def _memory(
+            exp: int | None,
+            m: str,
+            players: list[int],
+            shard: tuple[int, int] | None,
+        ) -> int:
+            keys = {"Matchup": m} if exp is None else {"Expansion": exp, "Matchup": m}
+            memory = sum(
+                estimate(self.estimates, "combinations", Players=pc, **keys)[2]
+                for pc in players
+            )
+            if shard is None:
+                return memory
+
+            # The shard's share of its input combinations
+            (_, length) = shard
+            return memory * length // max(input_rows[players[0]], 1)
+
+        self.threads = allocate_threads(
+            [_memory(*g) for g in self.combination_groups],
+            typing.cast(int, self.param_concurrency),
+        )
+        self.next(self.generate_combinations, foreach="combination_groups")
 
     @step
+    @traced
     def generate_combinations(self) -> None:
-        import polars as pl
+        from utilities.threads import use_threads
 
-        from transformations.sugr.spirits import generate_combinations
+        use_threads(self.threads[typing.cast(int, self.index)], "generate_combinations")
 
-        pc = typing.cast(int, self.input)
+        import polars as pl
 
-        print(self.expansion, self.matchup, pc)
-        self.combinations_ds.write(
-            generate_combinations(
-                pc,
-                self.matchups_ds.read(
-                    Expansion=self.expansion,
-                    Matchup=self.matchup,
-                ),
-                pl.scan_parquet(self.input_combinations[pc]),
-            ),
-            Expansion=self.expansion,
-            Players=pc,
-            Matchup=self.matchup,
+        from transformations.sugr.estimates import estimate
+        from transformations.sugr.spirits import (
+            combinations_for_expansion,
+            generate_all_combinations,
+            generate_combinations,
+            generate_lattice_combinations,
         )
 
-        self.next(self.collect_players)
-
-    @step
-    def collect_players(self, inputs: typing.Any) -> None:
-        self.merge_artifacts(
-            inputs,
-            include=[*__OUTPUT_ARTIFACTS__, *__DATASETS__],
+        (expansion, self.matchup, players, shard) = typing.cast(
+            tuple[int | None, str, list[int], tuple[int, int] | None],
+            self.input,
         )
-        self.next(self.collect_matchups)
 
-    @step
-    def collect_matchups(self, inputs: typing.Any) -> None:
-        self.merge_artifacts(
-            inputs,
-            include=[*__OUTPUT_ARTIFACTS__, *__DATASETS__],
+        print(expansion, self.matchup, players, shard)
+        if expansion is None:
+            with span("generate_lattice_combinations", "transformation"):
+                for pc, combinations in generate_lattice_combinations(
+                    max(players),
+                    self.matchups_ds.read(Matchup=self.matchup),
+                    fixed_point=self.scoring.fixed_point,
+                ):
+                    for exp, exp_players, matchups in self.expansion_matchups:
+                        if self.matchup not in matchups or pc not in exp_players:
+                            continue
+
+                        self._write_combinations(
+                            combinations_for_expansion(exp, combinations),
+                            exp,
+                            pc,
+                        )
+        elif len(players) > 1:
+            with span("generate_all_combinations", "transformation"):
+                for pc, combinations in generate_all_combinations(
+                    max(players),
+                    self.matchups_ds.read(Expansion=expansion, Matchup=self.matchup),
+                    fixed_point=self.scoring.fixed_point,
+                ):
+                    self._write_combinations(combinations, expansion, pc)
+        else:
+            (pc,) = players
+            combinations = pl.scan_parquet(self.input_combinations[pc])
+            (_, _, memory) = estimate(
+                self.estimates,
+                "combinations",
+                Expansion=expansion,
+                Players=pc,
+                Matchup=self.matchup,
+            )
+            if shard is not None:
+                combinations = combinations.slice(*shard)
+
+            # Shards of the same partition are appended alongside each other
+            # horizontal isn't supported by sink_parquet as of 1.2.1
+            with span("generate_combinations", "transformation", shard=shard):
+                self._write_combinations(
+                    generate_combinations(
+                        pc,
+                        self.matchups_ds.read(
+                            Expansion=expansion,
+                            Matchup=self.matchup,
+                        ),
+                        combinations,
+                        fixed_point=self.scoring.fixed_point,
+                    )
+                    .pipe(self.budget.collect, memory)
+                    .lazy(),
+                    expansion,
+                    pc,
+                )
+
+        self.peak_rss = self.budget.record("generate_combinations")
+        self.next(self.collect_combinations)
+
+    def _write_combinations(
+        self,
+        combinations: "pl.LazyFrame",
+        expansion: int,
+        players: int,
+    ) -> None:
+        import polars as pl
+
+        from transformations.sugr.games import factorize_components
+
+        self.combinations_ds.write(
+            combinations,
+            Expansion=expansion,
+            Players=players,
+            Matchup=self.matchup,
         )
-        self.next(self.collect_expansions)
+
+        # Each shard counts its own games, the site sums them to find its buckets
+        # group_by isn't supported by sink_parquet as of 1.2.1
+        if self.component_scores_ds is not None:
+            with span("factorize_components", "transformation"):
+                self.component_scores_ds.write(
+                    factorize_components(
+                        self.adversaries_ds.read(Expansion=expansion),
+                        combinations.with_columns(
+                            pl.lit(self.matchup).alias("Matchup"),
+                        ),
+                        use_expansion=False,
+                    )
+                    .drop("Matchup")
+                    .collect(streaming=True)
+                    .lazy(),
+                    Expansion=expansion,
+                    Players=players,
+                )
 
     @step
-    def collect_expansions(self, inputs: typing.Any) -> None:
+    @traced
+    def collect_combinations(self, inputs: typing.Any) -> None:
         self.merge_artifacts(
             inputs,
             include=[*__OUTPUT_ARTIFACTS__, *__DATASETS__],
@@ -225,10 +526,16 @@ class SugrGamesFlow(FlowSpec):
         self.next(self.branch_gametypes)
 
     @step
+    @traced
     def branch_gametypes(self) -> None:
-        self.next(self.bucket_horizons, self.bucket_preje, self.fanout_je)
+        self.next(
+            self.bucket_horizons,
+            self.bucket_preje,
+            self.fanout_je,
+        )
 
     @step
+    @traced
     def bucket_horizons(self) -> None:
         from transformations.sugr.expansions import horizons
         from transformations.sugr.games import (
@@ -239,21 +546,24 @@ class SugrGamesFlow(FlowSpec):
 
         bucket = horizons_bucket()
         print(str(bucket))
-        self.games_ds.write(
-            filter_by_bucket(
-                bucket,
-                create_games(
-                    horizons(self.adversaries_ds.read()),
-                    horizons(self.combinations_ds.read()),
+        with span("create_games", "transformation", bucket=str(bucket)):
+            self.games_ds.write(
+                filter_by_bucket(
+                    bucket,
+                    create_games(
+                        horizons(self.adversaries_ds.read()),
+                        horizons(self.combinations_ds.read()),
+                        scoring=self.scoring,
+                    ),
                 ),
-            ),
-            Difficulty=bucket.difficulty,
-            Complexity=bucket.complexity,
-        )
+                Difficulty=bucket.difficulty,
+                Complexity=bucket.complexity,
+            )
 
         self.next(self.join_gametypes)
 
     @step
+    @traced
     def bucket_preje(self) -> None:
         from transformations.sugr.expansions import preje
         from transformations.sugr.games import (
@@ -265,25 +575,33 @@ class SugrGamesFlow(FlowSpec):
         games = create_games(
             preje(self.adversaries_ds.read()),
             preje(self.combinations_ds.read()),
+            scoring=self.scoring,
         )
 
         for bucket in preje_buckets(games):
             print(str(bucket))
-            self.games_ds.write(
-                filter_by_bucket(bucket, games),
-                Difficulty=bucket.difficulty,
-                Complexity=bucket.complexity,
-            )
+            with span("create_games", "transformation", bucket=str(bucket)):
+                self.games_ds.write(
+                    filter_by_bucket(bucket, games),
+                    Difficulty=bucket.difficulty,
+                    Complexity=bucket.complexity,
+                )
 
         self.next(self.join_gametypes)
 
     @step
+    @traced
     def fanout_je(self) -> None:
+        from utilities.threads import allocate_threads
+
+        from transformations.sugr.estimates import estimate
         from transformations.sugr.expansions import expansions_and_players, jaggedearth
         from transformations.sugr.games import (
             create_games,
+            factorize_games,
             je_buckets,
         )
+        from transformations.sugr.shards import shard_ranges
 
         expansions = expansions_and_players(
             jaggedearth(self.input_expansions_ds.read()),
@@ -291,67 +609,224 @@ class SugrGamesFlow(FlowSpec):
             max_players=typing.cast(int, self.param_player_limit),
         )
 
+        # Factorized pairs give the same quantiles without creating the games
         buckets = je_buckets(
-            create_games(
+            (factorize_games if self.param_factorize else create_games)(
                 jaggedearth(self.adversaries_ds.read()),
                 jaggedearth(self.combinations_ds.read()),
+                scoring=self.scoring,
             ),
+            self.scoring,
         )
 
-        self.jaggedearth = [
-            (exp, pc, b)
-            for (exp, players) in expansions
-            if exp >= 17
-            for pc in players
-            for b in buckets
-        ]
-
+        # The largest partitions are split into ranges of their combinations
+        self.jaggedearth = []
+        for exp, players in expansions:
+            if exp < 17:
+                continue
+
+            for pc in players:
+                teams = self.combinations_ds.rows(Expansion=exp, Players=pc)
+                (games, _, memory) = estimate(
+                    self.estimates,
+                    "games",
+                    Expansion=exp,
+                    Players=pc,
+                )
+                self.jaggedearth.extend(
+                    (
+                        exp,
+                        pc,
+                        b,
+                        (offset, length),
+                        # The shard's share of the partition's memory
+                        memory * length // max(teams, 1),
+                    )
+                    for (offset, length) in shard_ranges(
+                        teams,
+                        games,
+                        typing.cast(int, self.param_shard_size),
+                    )
+                    for b in buckets
+                )
+
+        self.threads = allocate_threads(
+            [memory for (*_, memory) in self.jaggedearth],
+            typing.cast(int, self.param_concurrency),
+        )
         self.next(self.bucket_je, foreach="jaggedearth")
 
     @step
+    @traced
     def bucket_je(self) -> None:
+        from utilities.threads import use_threads
+
+        use_threads(self.threads[typing.cast(int, self.index)], "bucket_je")
+
         from transformations.sugr.games import (
             Bucket,
-            create_games,
-            filter_by_bucket,
         )
+        from transformations.sugr.shards import shard_ranges
 
-        (expansion, players, bucket) = typing.cast(tuple[int, int, Bucket], self.input)
+        (expansion, players, bucket, (offset, length), memory) = typing.cast(
+            tuple[int, int, Bucket, tuple[int, int], int],
+            self.input,
+        )
 
-        print(expansion, players, str(bucket))
-        self.games_ds.write(
-            filter_by_bucket(
+        # Shards which don't fit into the budget are processed a chunk at a time
+        chunks = self.budget.chunks(memory)
+        print(expansion, players, str(bucket), (offset, length), chunks)
+        for chunk_offset, chunk_length in shard_ranges(length, chunks, 1):
+            self._bucket_je_chunk(
+                expansion,
+                players,
                 bucket,
-                create_games(
-                    self.adversaries_ds.read(Expansion=expansion),
-                    self.combinations_ds.read(
-                        Expansion=expansion,
-                        Players=players,
-                        low_memory=True,
-                    ),
-                    use_expansion=False,
-                ),
-            ),
+                (offset + chunk_offset, chunk_length),
+                memory // chunks,
+            )
+
+        self.peak_rss = self.budget.record("bucket_je")
+        self.next(self.collect_jaggedearth)
+
+    def _bucket_je_chunk(
+        self,
+        expansion: int,
+        players: int,
+        bucket: "Bucket",
+        shard: tuple[int, int],
+        memory: int,
+    ) -> None:
+        from transformations.sugr.games import (
+            create_games,
+            factorize_games,
+            filter_by_bucket,
+            materialize_games,
+        )
+
+        adversaries = self.adversaries_ds.read(Expansion=expansion)
+        combinations = self.combinations_ds.read(
             Expansion=expansion,
             Players=players,
-            Difficulty=bucket.difficulty,
-            Complexity=bucket.complexity,
-        )
+            low_memory=self.budget.low_memory(memory),
+        ).slice(*shard)
+        with span("create_games", "transformation", bucket=str(bucket), shard=shard):
+            if self.param_factorize:
+                # Only the games for the bucket's adversary/team scores are created
+                games = materialize_games(
+                    factorize_games(
+                        adversaries,
+                        combinations,
+                        use_expansion=False,
+                        scoring=self.scoring,
+                    )
+                    .filter(bucket.expr)
+                    .pipe(self.budget.collect, memory)
+                    .lazy(),
+                    adversaries,
+                    combinations,
+                    use_expansion=False,
+                )
+            else:
+                games = filter_by_bucket(
+                    bucket,
+                    create_games(
+                        adversaries,
+                        combinations,
+                        use_expansion=False,
+                        scoring=self.scoring,
+                    ),
+                )
 
-        self.next(self.collect_jaggedearth)
+            self.games_ds.write(
+                games,
+                budget=self.budget,
+                estimate=memory,
+                Expansion=expansion,
+                Players=players,
+                Difficulty=bucket.difficulty,
+                Complexity=bucket.complexity,
+            )
 
     @step
+    @traced
     def collect_jaggedearth(self, inputs: typing.Any) -> None:
         self.merge_artifacts(inputs, include=[*__OUTPUT_ARTIFACTS__, *__DATASETS__])
         self.next(self.join_gametypes)
 
     @step
+    @traced
     def join_gametypes(self, inputs: typing.Any) -> None:
         self.merge_artifacts(inputs, include=[*__OUTPUT_ARTIFACTS__, *__DATASETS__])
+        self.next(self.normalize_games)
+
+    @step
+    @traced
+    def normalize_games(self) -> None:
+        import shutil
+
+        import polars as pl
+        from utilities.hive_dataset import HiveDataset
+
+        from transformations.sugr.games import (
+            adversary_levels,
+            game_teams,
+            normalize_games,
+        )
+
+        if self.param_normalize:
+            results = self.games_ds.path().parent
+            self.games_levels_ds = HiveDataset(results, "games_levels")
+            self.games_teams_ds = HiveDataset(
+                results,
+                "games_teams",
+                Players=pl.UInt8,  # type: ignore [argumentType]
+            )
+            self.games_normalized_ds = HiveDataset(
+                results,
+                "games_normalized",
+                Players=pl.UInt8,  # type: ignore [argumentType]
+                Difficulty=pl.UInt8,  # type: ignore [argumentType]
+                Complexity=pl.String,  # type: ignore [argumentType]
+            )
+
+            levels = adversary_levels(self.adversaries_ds.read())
+            self.games_levels_ds.write(levels)
+
+            partitions = self.games_ds.partitions()
+            for pc in sorted({p["Players"] for p in partitions}):
+                self.games_teams_ds.write(
+                    game_teams(self.combinations_ds.read(Players=pc)),
+                    Players=pc,
+                )
+
+            keys = ("Players", "Difficulty", "Complexity")
+            for part in sorted({tuple(p[k] for k in keys) for p in partitions}):
+                partition = dict(zip(keys, part, strict=True))
+                print(partition)
+                with span("normalize_games", "transformation"):
+                    self.games_normalized_ds.write(
+                        normalize_games(self.games_ds.read(**partition), levels),
+                        **partition,
+                    )
+
+            # Every game is in the normalized dataset with its Expansions
+            shutil.rmtree(self.games_ds.path())
+
+        # games_ds has no games left once they're normalized
+        self.games_normalized = typing.cast(bool, self.param_normalize)
+
+        self.peak_rss = self.budget.record("normalize_games")
         self.next(self.end)
 
     @step
+    @traced
     def end(self) -> None:
+        from utilities.tracing import timeline
+
+        self.timeline = timeline(
+            typing.cast(str, current.flow_name),
+            typing.cast(str, current.run_id),
+        )
         if not self.param_keep:
             self.ephemeral.cleanup()
 
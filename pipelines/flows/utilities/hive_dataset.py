@@ -1,10 +1,15 @@
-import gc
 import typing
 from pathlib import Path
 from uuid import uuid4
 
 import polars as pl
 
+from .profiling import capture
+from .tracing import span
+
+if typing.TYPE_CHECKING:
+    from utilities.memory_budget import MemoryBudget
+
 
 class KeyMismatchError(Exception):
     """Indicates an incompatibility between the Hive schema and contextual keys."""
@@ -64,6 +69,10 @@ class HiveDataset:
             msg = f"Got extra partition keys: {"', '".join(extra_keys)}"
             raise KeyMismatchError(msg)
 
+        # Sorted so row offsets are stable between readers
+        # Reads are lazy, the rows are traced where the plan is sunk or collected
+        files = sorted(self._files(**kwargs))
+
         # https://github.com/pola-rs/polars/issues/12508
         return pl.concat(
             (
@@ -73,12 +82,7 @@ class HiveDataset:
                     hive_schema=self._schema,
                     hive_partitioning=len(self._schema) > 0,
                 )
-                for f in self._dataset_path.glob(
-                    str(
-                        Path(*[f"{k}={kwargs.get(k, '*')}" for k in self._schema])
-                        / "*.parquet",
-                    ),
-                )
+                for f in files
             ),
             how="diagonal_relaxed",
             rechunk=True,
@@ -89,14 +93,19 @@ class HiveDataset:
         frame: pl.LazyFrame,
         *,
         allow_empty: bool = False,
+        budget: "MemoryBudget | None" = None,
+        estimate: int | None = None,
         **kwargs: typing.Any,
     ) -> None:
         """Appends data to the dataset using Hive-style partitioning.
 
         Partitioning will be inferred based on the schema of the Hive keys.
+        Frames which can't be sunk are collected within the budget instead.
 
         Args:
             frame: The lazyframe to append.
+            budget: The MemoryBudget to collect frames which can't be sunk with.
+            estimate: The estimated bytes of the frame for the budget.
             **kwargs: Contextual values for use in Hive partitioning.
               These are treated as constants and should not appear in the frame.
         """
@@ -108,10 +117,7 @@ class HiveDataset:
             msg = f"Got extra partition keys: {"', '".join(extra_keys)}"
             raise KeyMismatchError(msg)
 
-        schema = frame.collect_schema()
-        columns = set(schema.names())
-        del schema
-        gc.collect()
+        columns = set(frame.collect_schema().names())
 
         overspecified_keys = contextual_keys.intersection(columns)
         if len(overspecified_keys) > 0:
@@ -129,8 +135,6 @@ class HiveDataset:
         if len(frame_keys) > 0:
             values = frame.clone().select(frame_keys).unique().collect(streaming=True)
             parts = [({**kwargs, **p}, p) for p in values.to_dicts()]
-            del values
-            gc.collect()
 
             if len(parts) == 0:
                 empty = frame.select(pl.len()).collect(streaming=True).item(0, 0) == 0
@@ -143,26 +147,120 @@ class HiveDataset:
             parts = [(kwargs, {})]
 
         batch = str(uuid4())
-        for segment, part in parts:
-            path = Path(*[f"{k}={segment[k]}" for k in self._keys])
-
-            (self._dataset_path / path).mkdir(mode=0o755, parents=True, exist_ok=True)
-            partition = (
-                frame.clone().filter(**part).drop(part.keys())
-                if len(part) > 0
-                else frame.clone()
-            )
-            partition.sink_parquet(
-                self._dataset_path / path / f"{batch}-0.parquet",
-                maintain_order=False,
-            )
-            del partition
-            gc.collect()
+        files = []
+        with span(self._dataset_path.name, "write", **kwargs) as args:
+            for segment, part in parts:
+                path = Path(*[f"{k}={segment[k]}" for k in self._keys])
+
+                (self._dataset_path / path).mkdir(
+                    mode=0o755,
+                    parents=True,
+                    exist_ok=True,
+                )
+                partition = (
+                    frame.clone().filter(**part).drop(part.keys())
+                    if len(part) > 0
+                    else frame.clone()
+                )
+                file = self._dataset_path / path / f"{batch}-0.parquet"
+                capture(partition, self._dataset_path.name)
+                try:
+                    partition.sink_parquet(file, maintain_order=False)
+                except pl.exceptions.InvalidOperationError:
+                    # Not every operation can be sunk as of 1.2.1
+                    if budget is None:
+                        partition.collect(streaming=True).write_parquet(file)
+                    else:
+                        budget.collect(partition, estimate).write_parquet(file)
+                files.append(file)
+
+            args.update(_footers(files))
 
     def partitions(self) -> list[dict[str, typing.Any]]:
-        uniques = self.read().select(self._keys).unique().sort(*self._keys)
-        values = uniques.collect(streaming=True).rows(named=True)
-        del uniques
-        gc.collect()
+        """The sorted key/values of every partition.
+
+        Parsed from the key=value directories of the files and typed by
+        the Hive schema, no files are opened.
+        """
+        directories = {f.parent.relative_to(self._dataset_path) for f in self._files()}
+        values = pl.DataFrame(
+            [[part.split("=", 1)[1] for part in d.parts] for d in directories],
+            schema=dict.fromkeys(self._keys, pl.String),
+            orient="row",
+        )
+        return (
+            values.select(pl.col(k).cast(dtype) for (k, dtype) in self._schema.items())
+            .sort(*self._keys)
+            .rows(named=True)
+        )
+
+    def size(self, **kwargs: typing.Any) -> int:
+        """The bytes on disk of the dataset, or the partition given by kwargs."""
+        return sum(f.stat().st_size for f in self._files(**kwargs))
+
+    def rows(self, **kwargs: typing.Any) -> int:
+        """The rows of the dataset, or the partition given by kwargs.
+
+        Counted from the parquet footers without scanning.
+        """
+        return _rows(list(self._files(**kwargs)))
+
+    def null_columns(self, **kwargs: typing.Any) -> list[str] | None:
+        """Columns entirely null in the dataset, or the partition given by kwargs.
+
+        Found from the null counts in the parquet footers without scanning,
+        None when a file is missing them.
+        """
+        import pyarrow.parquet as pq
+
+        files: list[tuple[int, dict[str, int]]] = []
+        for f in self._files(**kwargs):
+            metadata = pq.read_metadata(f)
+            nulls: dict[str, int] = {}
+            for g in range(metadata.num_row_groups):
+                group = metadata.row_group(g)
+                for c in range(group.num_columns):
+                    column = group.column(c)
+                    stats = column.statistics
+                    if stats is None or not stats.has_null_count:
+                        return None
+                    nulls[column.path_in_schema] = (
+                        nulls.get(column.path_in_schema, 0) + stats.null_count
+                    )
+            files.append((metadata.num_rows, nulls))
+
+        # Columns missing from a file are read as nulls
+        columns = {c: None for (_, nulls) in files for c in nulls}
+        return [
+            c
+            for c in columns
+            if all(nulls.get(c, rows) == rows for (rows, nulls) in files)
+        ]
+
+    def _files(self, **kwargs: typing.Any) -> typing.Iterator[Path]:
+        return self._dataset_path.glob(
+            str(
+                Path(*[f"{k}={kwargs.get(k, '*')}" for k in self._schema])
+                / "*.parquet",
+            ),
+        )
+
+
+def _footers(files: list[Path]) -> dict[str, int]:
+    return {
+        "files": len(files),
+        "rows": _rows(files),
+        "bytes": sum(f.stat().st_size for f in files),
+    }
+
 
-        return values
+def _rows(files: list[Path]) -> int:
+    # Counting rows only reads the parquet footers
+    return (
+        pl.scan_parquet(files, hive_partitioning=False)
+        .select(pl.len())
+        .collect()
+        .item()
+        if len(files) > 0
+        else 0
+    )
@@ -0,0 +1,160 @@
+"""Chooses how Polars executes plans within a memory budget."""
+
+import contextlib
+import enum
+import math
+import os
+import resource
+import threading
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import polars as pl
+
+from .profiling import capture
+from .tracing import span
+
+# Polars needs room for intermediate copies when collecting in memory
+_HEADROOM = 4
+
+
+class Strategy(enum.Enum):
+    """The ways a plan can be executed, from fastest to lowest memory."""
+
+    IN_MEMORY = "in-memory"
+    STREAMING = "streaming"
+    CHUNKED = "chunked"
+    SPILL = "spill"
+
+
+class MemoryBudget:
+    """Picks execution strategies for plans based on their estimated memory."""
+
+    def __init__(self, budget: int = 0, temp_dir: str | Path | None = None) -> None:
+        """Creates a new picklable MemoryBudget.
+
+        Args:
+            budget: Bytes available to the step, 0 always streams without a budget.
+            temp_dir: Where Polars spills to when plans don't fit into the budget.
+        """
+        self.budget = budget
+        self.temp_dir = temp_dir
+
+    @classmethod
+    def from_mib(cls, mib: int, temp_dir: str | Path | None = None) -> "MemoryBudget":
+        """Creates a new MemoryBudget of mib MiB."""
+        return cls(mib << 20, temp_dir)
+
+    def strategy(self, estimate: int | None, *, chunkable: bool = False) -> Strategy:
+        """Picks the fastest strategy for a plan estimated to need estimate bytes.
+
+        Args:
+            estimate: Estimated bytes of the plan, None when it isn't known.
+            chunkable: The plan can be split into smaller plans by the caller.
+        """
+        if self.budget <= 0 or estimate is None:
+            return Strategy.STREAMING
+        if estimate * _HEADROOM <= self.budget:
+            return Strategy.IN_MEMORY
+        if estimate <= self.budget:
+            return Strategy.STREAMING
+
+        return Strategy.CHUNKED if chunkable else Strategy.SPILL
+
+    def low_memory(self, estimate: int | None) -> bool:
+        """If plans estimated to need estimate bytes should scan with low_memory."""
+        return self.strategy(estimate) != Strategy.IN_MEMORY
+
+    def chunks(self, estimate: int | None) -> int:
+        """The number of chunks a chunkable plan should be split into."""
+        if self.strategy(estimate, chunkable=True) != Strategy.CHUNKED:
+            return 1
+
+        return math.ceil(typing.cast(int, estimate) / self.budget)
+
+    def collect(self, frame: pl.LazyFrame, estimate: int | None = None) -> pl.DataFrame:
+        """Collects the frame using the strategy for its estimated bytes."""
+        strategy = self.strategy(estimate)
+        capture(frame, "collect", streaming=strategy != Strategy.IN_MEMORY)
+        with span("collect", "collect", strategy=strategy.value) as args:
+            if strategy == Strategy.IN_MEMORY:
+                collected = frame.collect()
+            else:
+                with (
+                    self._spilling()
+                    if strategy == Strategy.SPILL
+                    else contextlib.nullcontext()
+                ):
+                    collected = frame.collect(streaming=True)
+
+            args.update(rows=collected.height, bytes=collected.estimated_size())
+
+        return collected
+
+    def map[T, R](
+        self,
+        fn: typing.Callable[[T], R],
+        items: list[T],
+        estimates: list[int | None],
+        workers: int,
+    ) -> list[R]:
+        """Runs fn over the items on workers threads within the budget.
+
+        An item only starts once its estimated bytes fit into the budget
+        alongside the items already running, one bigger than the budget
+        runs alone. Polars and pyarrow release the GIL while they work.
+
+        Args:
+            fn: Processes an item, i.e. packages a partition.
+            items: The items to process.
+            estimates: Estimated bytes of processing each item.
+            workers: Most items processed at once.
+        """
+        running = 0
+        available = threading.Condition()
+
+        def _run(item: T, estimate: int | None) -> R:
+            nonlocal running
+            cost = min(estimate or 0, self.budget) if self.budget > 0 else 0
+            with available:
+                available.wait_for(
+                    lambda: running == 0 or running + cost <= self.budget,
+                )
+                running += cost
+            try:
+                return fn(item)
+            finally:
+                with available:
+                    running -= cost
+                    available.notify_all()
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(_run, items, estimates))
+
+    def record(self, label: str) -> int:
+        """Reports and returns the peak RSS of the process against the budget."""
+        # Linux reports kilobytes
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss << 10
+        budget = f"{self.budget >> 20} MiB" if self.budget > 0 else "no"
+        over = " (over budget)" if 0 < self.budget < peak else ""
+        print(f"{label}: peak RSS {peak >> 20} MiB of {budget} budget{over}")
+        return peak
+
+    @contextlib.contextmanager
+    def _spilling(self) -> typing.Iterator[None]:
+        previous = {
+            k: os.environ.get(k) for k in ["POLARS_FORCE_OOC", "POLARS_TEMP_DIR"]
+        }
+        os.environ["POLARS_FORCE_OOC"] = "1"
+        if self.temp_dir is not None:
+            os.environ["POLARS_TEMP_DIR"] = str(self.temp_dir)
+
+        try:
+            yield
+        finally:
+            for k, v in previous.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
@@ -0,0 +1,42 @@
+"""Captures the query plans and node timings of the Polars plans a task runs."""
+
+import itertools
+from pathlib import Path
+
+import polars as pl
+
+# Where this task's plans are captured, None when capturing is off
+_directory: Path | None = None
+_captured = itertools.count()
+
+
+def enable(directory: Path | None) -> None:
+    """Captures the plans of this task into directory, None turns capturing off."""
+    global _directory  # noqa: PLW0603
+    _directory = directory
+    if directory is not None:
+        directory.mkdir(mode=0o755, parents=True, exist_ok=True)
+
+
+def capture(frame: pl.LazyFrame, name: str, *, streaming: bool = True) -> None:
+    """Stores the plan and node timings of the frame, if capturing is enabled.
+
+    The plan is written to <n>-<name>.plan.txt and the timings of profile()
+    to <n>-<name>.profile.parquet. Profiling runs the plan an extra time
+    and holds its result in memory, which is why capturing is opt-in.
+
+    Args:
+        frame: The plan about to be sunk or collected.
+        name: Name of the plan, i.e. the dataset it's written to.
+        streaming: If the plan is run by the streaming engine.
+    """
+    if _directory is None:
+        return
+
+    prefix = _directory / f"{next(_captured):04}-{name}"
+    Path(f"{prefix}.plan.txt").write_text(
+        frame.explain(streaming=streaming),
+        encoding="utf-8",
+    )
+    (_, timings) = frame.profile(streaming=streaming)
+    timings.write_parquet(f"{prefix}.profile.parquet")
@@ -0,0 +1,72 @@
+"""Shares the node's cores and work between the concurrent tasks of foreach steps."""
+
+import heapq
+import math
+import os
+
+import polars as pl
+
+# Polars sizes its own pool, other Rust extensions size their rayon pools
+# pyarrow's pool isn't rayon's and keeps its default size
+_POOLS = ["POLARS_MAX_THREADS", "RAYON_NUM_THREADS"]
+
+
+def allocate_threads(
+    sizes: list[int],
+    concurrency: int,
+    cpus: int | None = None,
+) -> list[int]:
+    """Allocates threads to each task in proportion to its estimated size.
+
+    Tasks of an average size get an even share of the cores between the
+    tasks running at once, big ones more (up to every core) and tiny ones one.
+
+    Args:
+        sizes: Estimated sizes of the foreach's tasks, i.e. bytes of memory.
+        concurrency: Tasks running at once, i.e. the run's --max-workers.
+        cpus: Cores of the node, defaults to the cores of this one.
+    """
+    cpus = cpus or os.cpu_count() or 1
+    running = max(1, min(concurrency, len(sizes)))
+    mean = sum(sizes) / max(len(sizes), 1)
+    share = cpus / running
+
+    return [
+        max(1, min(cpus, round(share * s / mean) if mean > 0 else int(share)))
+        for s in sizes
+    ]
+
+
+def distribute(sizes: list[int], per_task: int) -> list[list[int]]:
+    """Groups work into tasks of about per_task items and balanced sizes.
+
+    The biggest items are placed first, each into the smallest task so far.
+
+    Args:
+        sizes: Estimated sizes of the items, i.e. bytes of memory.
+        per_task: Items of a task on average, there are len(sizes) / per_task tasks.
+
+    Returns:
+        The indices of the items of each task, in their original order.
+    """
+    tasks: list[list[int]] = [[] for _ in range(math.ceil(len(sizes) / per_task))]
+    smallest = [(0, t) for t in range(len(tasks))]
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i], reverse=True):
+        (size, t) = heapq.heappop(smallest)
+        tasks[t].append(i)
+        heapq.heappush(smallest, (size + sizes[i], t))
+
+    return [sorted(t) for t in tasks]
+
+
+def use_threads(threads: int, label: str) -> None:
+    """Sizes the thread pools of this task, before Polars first runs a plan."""
+    for pool in _POOLS:
+        os.environ[pool] = str(threads)
+
+    # Polars' pool is sized the first time it's used and can't be resized
+    size = pl.thread_pool_size()
+    if size != threads:
+        print(f"{label}: Polars already started with {size} threads, not {threads}")
+
+    print(f"{label}: using {size} of {os.cpu_count()} threads")
@@ -0,0 +1,106 @@
+"""Records where the wall time of flows goes as a Chrome trace timeline."""
+
+import contextlib
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import typing
+
+from . import profiling
+
+# The complete events of this task, traces don't outlive their process
+_events: list[dict[str, typing.Any]] = []
+
+
+@contextlib.contextmanager
+def span(
+    name: str,
+    category: str,
+    **kwargs: typing.Any,
+) -> typing.Iterator[dict[str, typing.Any]]:
+    """Records the block as a complete event on the task's timeline.
+
+    Args:
+        name: Name of the event, i.e. the step or transformation.
+        category: Kind of the event, i.e. step, collect, write or transformation.
+        **kwargs: Args of the event, the yielded dict can be updated with more.
+    """
+    args = dict(kwargs)
+    start = time.time_ns() // 1000
+    try:
+        yield args
+    finally:
+        args["peak_rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss << 10
+        _events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": start,
+                "dur": time.time_ns() // 1000 - start,
+                "pid": os.getpid(),
+                "tid": threading.get_native_id(),
+                "args": args,
+            },
+        )
+
+
+def events() -> list[dict[str, typing.Any]]:
+    """The events recorded by this task so far."""
+    return _events.copy()
+
+
+def traced(step: typing.Callable[..., None]) -> typing.Callable[..., None]:
+    """Traces a step and stores its events in the trace artifact.
+
+    Must be placed under @step so metaflow finds the step's source.
+    """
+
+    @functools.wraps(step)
+    def _traced(flow: typing.Any, *args: typing.Any) -> None:
+        from metaflow import current  # pyright: ignore [reportPrivateImportUsage]
+
+        _events.clear()
+        profiles = getattr(flow, "profiles", None)
+        profiling.enable(
+            None
+            if profiles is None
+            else profiles.path / step.__name__ / str(current.task_id),
+        )
+        with span(step.__name__, "step", task=current.pathspec):
+            step(flow, *args)
+
+        # Each task is a row of the timeline named after it
+        pid = int(typing.cast(str, current.task_id))
+        flow.trace = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": pid,
+                "args": {"name": current.pathspec},
+            },
+            *({**e, "pid": pid} for e in _events),
+        ]
+
+    return _traced
+
+
+def timeline(flow_name: str, run_id: str) -> str:
+    """Merges the trace artifacts of every finished task of the run.
+
+    The json can be opened with chrome://tracing or ui.perfetto.dev.
+    """
+    from metaflow import Run, namespace  # pyright: ignore [reportPrivateImportUsage]
+
+    namespace(None)
+    events = [
+        event
+        for step in Run(f"{flow_name}/{run_id}")
+        for task in step
+        if "trace" in task
+        for event in task["trace"].data
+    ]
+    return json.dumps({"traceEvents": events, "displayTimeUnit": "ms"})
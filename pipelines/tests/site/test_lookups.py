@@ -0,0 +1,43 @@
+import polars as pl
+
+from transformations.site import lookups as uut
+
+adversaries = pl.LazyFrame(
+    {
+        "Name": ["England", "England", "Sweden"],
+        "Level": [0, 1, 0],
+        "Matchup": ["Tier", "England", "Tier"],
+        "Difficulty": [1, 3, 1],
+    },
+)
+
+
+def test_adversary_lookup() -> None:
+    assert uut.adversary_lookup(adversaries) == {
+        "England": {"0": (1, "Tier"), "1": (3, "England")},
+        "Sweden": {"0": (1, "Tier")},
+    }
+
+
+def test_spirit_lookup() -> None:
+    spirits = pl.LazyFrame(
+        {
+            "Name": ["Lightning", "Lightning", "Earth"],
+            "Aspect": [None, "Wind", None],
+            "Complexity": ["Intro", "Intro", "Low"],
+            "Tier": ["C", "B", "A"],
+            "England": ["D", "C", "B"],
+            "Sweden": ["C", "A", "B"],
+        },
+    )
+
+    assert uut.spirit_lookup(
+        spirits,
+        adversaries.filter(pl.col("Name") == "England"),
+    ) == {
+        "Lightning": {
+            "Base": {"Tier": "C", "England": "D"},
+            "Wind": {"Tier": "B", "England": "C"},
+        },
+        "Earth": {"Base": {"Tier": "A", "England": "B"}},
+    }
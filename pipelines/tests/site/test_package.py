@@ -1,4 +1,7 @@
+from pathlib import Path
+
 import polars as pl
+import pytest
 
 
 def test_drop_nulls() -> None:
@@ -16,27 +19,196 @@ def test_drop_nulls() -> None:
     results = uut(frame)
     assert results.collect(streaming=True).schema.names() == ["no-nulls", "some-nulls"]
 
+    # Known null columns are dropped without scanning for them
+    results = uut(frame, ["all-nulls"])
+    assert results.collect_schema().names() == [
+        "no-nulls",
+        "some-nulls",
+        "another-all-nulls",
+    ]
+
 
-def test_batch() -> None:
-    from transformations.site.package import batch as uut
+def test_package(tmp_path: Path) -> None:
+    from transformations.site.package import package as uut
 
     frame = pl.LazyFrame(
         [*range(100)],
-        schema="a",
+        schema=[("a", pl.Int64)],
+        orient="row",
+    )
+
+    assert uut(frame, tmp_path, rows=15).rows == 100
+    files = {_start(f): pl.read_ipc(f) for f in tmp_path.glob("*.feather")}
+    assert sorted(files) == [0, 15, 30, 45, 60, 75, 90]
+    assert [files[s].height for s in sorted(files)] == [15, 15, 15, 15, 15, 15, 10]
+    assert pl.concat(files[s] for s in sorted(files)).equals(frame.collect())
+
+    # Files are also limited by their bytes, 8 bytes per row here
+    small = tmp_path / "small"
+    small.mkdir()
+    assert uut(frame, small, size=8 * 40).rows == 100
+    assert sorted(_start(f) for f in small.glob("*.feather")) == [0, 40, 80]
+
+    # Empty frames still have their schema written
+    (tmp_path / "empty").mkdir()
+    assert uut(frame.head(0), tmp_path / "empty").rows == 0
+    (empty,) = (tmp_path / "empty").glob("*.feather")
+    assert pl.read_ipc(empty).columns == ["a"]
+
+
+def test_package_unchanged(tmp_path: Path) -> None:
+    from transformations.site.package import package as uut
+
+    frame = pl.LazyFrame(
+        [*range(100)],
+        schema=[("a", pl.Int64)],
+        orient="row",
+    )
+    packaged = uut(frame, tmp_path, rows=15)
+    assert packaged.written_bytes is not None
+    written = {f.name: f.stat().st_mtime_ns for f in tmp_path.iterdir()}
+
+    # Nothing is rewritten when the frame and arguments are the same
+    assert uut(frame, tmp_path, rows=15) == type(packaged)(packaged.manifest, 100)
+    assert {f.name: f.stat().st_mtime_ns for f in tmp_path.iterdir()} == written
+
+    # Otherwise the new files are added alongside, the same contents by the same name
+    assert uut(frame, tmp_path, rows=40).manifest != packaged.manifest
+    assert uut(frame.head(99), tmp_path, rows=40).written_bytes is not None
+    starts = sorted(_start(f) for f in tmp_path.glob("*.feather"))
+    # Only the last file of the shorter frame differs from the files before it
+    assert starts == [0, 0, 15, 30, 40, 45, 60, 75, 80, 80, 90]
+    assert len(list(tmp_path.glob("manifest.*.json"))) == 3
+
+
+def test_package_format(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from transformations.site import package
+    from transformations.site.package import package as uut
+
+    frame = pl.LazyFrame({"a": [1, 2, 3]})
+    packaged = uut(frame, tmp_path)
+
+    # Packages written by a previous format are rewritten
+    monkeypatch.setattr(package, "PACKAGE_FORMAT", package.PACKAGE_FORMAT + 1)
+    repackaged = uut(frame, tmp_path)
+    assert repackaged.manifest != packaged.manifest
+    assert repackaged.written_bytes is not None
+
+
+def test_publish(tmp_path: Path) -> None:
+    import json
+
+    from transformations.site.package import (
+        MANIFEST,
+        PREVIOUS_MANIFEST,
+        content_address,
+        package,
+    )
+    from transformations.site.package import publish as uut
+
+    frame = pl.LazyFrame({"a": [1, 2, 3]})
+    partitions = {}
+    for partition in ["Players=1/Type=A", "Players=1/Type=B", "Players=2/Type=A"]:
+        (tmp_path / partition).mkdir(parents=True)
+        manifest = package(frame, tmp_path / partition).manifest
+        partitions[partition] = manifest
+    package(frame.head(2), tmp_path / "Players=1/Type=A")
+    (tmp_path / "spirits.json").write_text("{}")
+    inputs = {"spirits.json": content_address(tmp_path / "spirits.json").name}
+    assert inputs["spirits.json"] == "spirits.44136fa355b3678a.json"
+
+    removed = uut(
+        tmp_path,
+        inputs,
+        {"Players=1/Type=A": partitions["Players=1/Type=A"]},
+    )
+    assert len(removed) == 6
+    assert json.loads((tmp_path / MANIFEST).read_text()) == {
+        "inputs": inputs,
+        "partitions": {"Players=1/Type=A": partitions["Players=1/Type=A"]},
+    }
+    assert sorted(
+        p.relative_to(tmp_path).as_posix() for p in tmp_path.rglob("*") if p.is_dir()
+    ) == ["Players=1", "Players=1/Type=A"]
+    assert len(list((tmp_path / "Players=1/Type=A").iterdir())) == 2
+
+    # Pages which loaded the previous manifest can still read its files
+    (tmp_path / "Players=2/Type=A").mkdir(parents=True)
+    second = {
+        "Players=2/Type=A": package(frame, tmp_path / "Players=2/Type=A").manifest,
+    }
+    assert uut(tmp_path, inputs, second) == []
+    assert json.loads((tmp_path / PREVIOUS_MANIFEST).read_text()) == {
+        "inputs": inputs,
+        "partitions": {"Players=1/Type=A": partitions["Players=1/Type=A"]},
+    }
+
+    # Only once it's older than the previous manifest
+    removed = uut(tmp_path, inputs, second)
+    assert sorted(p.parent.relative_to(tmp_path).as_posix() for p in removed) == [
+        "Players=1/Type=A",
+        "Players=1/Type=A",
+    ]
+    assert not (tmp_path / "Players=1").exists()
+    assert (tmp_path / "Players=2/Type=A" / second["Players=2/Type=A"]).exists()
+
+
+def test_pick(tmp_path: Path) -> None:
+    import json
+    import random
+
+    from transformations.site.package import package, pick
+
+    frame = pl.LazyFrame(
+        [*range(100)],
+        schema=[("a", pl.Int64)],
         orient="row",
     )
+    manifest = tmp_path / package(frame, tmp_path, rows=15).manifest
+
+    listing = json.loads(manifest.read_text())
+    assert listing["rows"] == 100
+    assert listing["offsets"] == [0, 15, 30, 45, 60, 75, 90]
+    assert listing["files"][-1].startswith("90.")
 
-    batches = []
-    for i, ((s, e), f) in enumerate(uut(frame, 15)):
-        batches.append(s)
+    # Rows are picked from every file, not just the first
+    rng = random.Random(42)  # noqa: S311
+    picked = {pick(manifest, rng)["a"] for _ in range(1_000)}  # type: ignore [index]
+    assert picked == set(range(100))
 
-        if i < 6:
-            assert f.collect(streaming=True).height == 15
-        else:
-            assert f.collect(streaming=True).height == 10
-            assert e == 100
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    assert pick(empty / package(frame.head(0), empty).manifest) is None
 
-    assert batches == [0, 15, 30, 45, 60, 75, 90]
+
+def test_package_encoded(tmp_path: Path) -> None:
+    import pyarrow as pa
+
+    from transformations.site.package import package as uut
+
+    frame = pl.LazyFrame(
+        {
+            "Spirit": [f"Spirit {i % 40}" for i in range(10_000)],
+            "Adversary": [f"Adversary {i % 400}" for i in range(10_000)],
+            "Level": [i % 7 for i in range(10_000)],
+        },
+    )
+
+    for compression in [None, "lz4", "zstd"]:
+        path = tmp_path / str(compression)
+        path.mkdir()
+        packaged = uut(frame, path, rows=3_000, compression=compression)
+        assert packaged.rows == 10_000
+        assert packaged.written_bytes < packaged.plain_bytes  # type: ignore [operator]
+
+        files = sorted(path.glob("*.feather"), key=_start)
+        table = pa.concat_tables(pa.ipc.open_file(f).read_all() for f in files)
+        assert table.schema.field("Spirit").type == pa.dictionary(
+            pa.int8(),
+            pa.large_string(),
+        )
+        assert table.schema.field("Adversary").type.index_type == pa.int16()
+        assert pl.from_arrow(table).equals(frame.collect())  # type: ignore [union-attr]
 
 
 def test_sample() -> None:
@@ -56,3 +228,32 @@ def test_sample() -> None:
 
         unique = result.unique().select(pl.len()).collect().item(0, 0)
         assert unique == actual == i
+
+
+def test_sample_uniform() -> None:
+    from transformations.site.package import sample as uut
+
+    frame = pl.LazyFrame(
+        [*range(10_000)],
+        schema=[("a", pl.Int64)],
+        orient="row",
+    )
+
+    result = uut(frame, 1_000).collect(streaming=True)
+    assert result.height == result.n_unique() == 1_000
+
+    # The same rows are picked however the frame is ordered
+    shuffled = frame.collect().sample(fraction=1, shuffle=True, seed=42).lazy()
+    assert uut(shuffled, 1_000).collect().equals(result)
+    assert not uut(frame, 1_000, seed=1).collect().equals(result)
+
+    # Every tenth of the frame is sampled about evenly, including the first file
+    for rows in [result, result.head(200)]:
+        tenths = rows.group_by(pl.col("a") // 1_000).len()["len"]
+        assert tenths.len() == 10
+        assert tenths.min() >= rows.height // 20  # type: ignore [operator]
+
+
+def _start(file: Path) -> int:
+    # Files are named after their first row and the digest of their contents
+    return int(file.name.split(".")[0])
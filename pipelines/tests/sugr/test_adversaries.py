@@ -1,6 +1,18 @@
 import polars as pl
 
-from transformations.sugr.adversaries import adversaries_by_expansions as uut
+from transformations.sugr.adversaries import adversaries_by_expansions
+from transformations.sugr.expansions import slice_by_expansions
+
+
+def uut(
+    expansions: int,
+    adversaries: pl.LazyFrame,
+    escalations: pl.LazyFrame,
+) -> tuple[pl.LazyFrame, list[str]]:
+    return adversaries_by_expansions(
+        slice_by_expansions([expansions], adversaries).drop("Set"),
+        slice_by_expansions([expansions], escalations, disjoint=True).drop("Set"),
+    )
 
 
 class TestAdversariesByExpansions:
@@ -43,7 +55,7 @@ class TestAdversariesByExpansions:
         (filtered, collected) = uut(
             1 | 4 | 16,
             self.adversaries,
-            pl.LazyFrame(),
+            self.escalations,
         )
 
         expected = self.adversaries.collect().to_dict(as_series=False)
@@ -104,7 +116,7 @@ class TestAdversariesByExpansions:
         (adversaries, _) = uut(
             1 | 4 | 8 | 16,
             self.adversaries,
-            pl.LazyFrame(),
+            self.escalations,
         )
 
         france = (
@@ -0,0 +1,44 @@
+import polars as pl
+
+
+def test_estimate_games() -> None:
+    from transformations.sugr.estimates import estimate
+    from transformations.sugr.estimates import estimate_games as uut
+
+    expansions = pl.LazyFrame({"Expansion": [1], "Players": [2], "Names": ["Base"]})
+    adversaries = pl.LazyFrame(
+        {
+            "Name": ["A1", "A1", "A2"],
+            "Level": [0, 1, 0],
+            "Expansion": [1, 1, 1],
+            "Matchup": ["Tier", "Tier", "France"],
+            "Difficulty": [1, 2, 2],
+            "Complexity": ["Low", "Low", "High"],
+        },
+    )
+    escalations = pl.LazyFrame({"Escalation": ["E1", "E2"], "Expansion": [1, 2]})
+    spirits = pl.LazyFrame(
+        {
+            "Name": ["S1", "S2", "S3", "S4", "S5"],
+            "Aspect": [None] * 5,
+            "Complexity": ["Low", "Moderate", "High", "Very High", "Low"],
+            "Expansion": [1, 1, 1, 1, 2],
+            "Tier": ["A", "B", "C", "X", "S"],
+            # F isn't a valid rating outside of Tier
+            "France": ["A", "F", "D", "S", "S"],
+        },
+    )
+
+    estimates = uut(expansions, adversaries, escalations, spirits)
+    assert estimate(estimates, "matchups", Matchup="Tier")[0] == 4
+    assert estimate(estimates, "matchups", Matchup="France")[0] == 3
+
+    # Tier has A1 0/1 and the Escalation padding, France has A2 0
+    assert estimate(estimates, "games", Players=1)[0] == 4 * 3 + 3 * 1
+    assert estimate(estimates, "combinations", Players=2)[0] == 6 + 3
+    assert estimate(estimates, "games", Players=2)[0] == 6 * 3 + 3 * 1
+    assert estimate(estimates, "bucket", Players=2)[0] == 4
+
+    for stage in ["matchups", "combinations", "games", "bucket"]:
+        (rows, size, memory) = estimate(estimates, stage)
+        assert rows < size < memory
@@ -0,0 +1,25 @@
+import polars as pl
+
+
+def test_slice_by_expansions() -> None:
+    from transformations.sugr.expansions import slice_by_expansions as uut
+
+    frame = pl.LazyFrame(
+        {
+            "Name": ["R1", "R2", "R3", "R4", "R5", "R6"],
+            "Expansion": [1, 1, 4, 8, 16, None],
+        },
+    )
+
+    def _names(sliced: pl.LazyFrame) -> dict[int, list[str]]:
+        rows = sliced.group_by("Set").agg(pl.col("Name").sort()).collect().rows()
+        return dict(rows)
+
+    assert _names(uut([1, 1 | 4, 2], frame)) == {
+        1: ["R1", "R2"],
+        1 | 4: ["R1", "R2", "R3"],
+    }
+    assert _names(uut([1 | 4, 1 | 4 | 8 | 16], frame, disjoint=True)) == {
+        1 | 4: ["R4", "R5"],
+    }
+    assert uut([1], frame).collect_schema().names() == ["Name", "Expansion", "Set"]
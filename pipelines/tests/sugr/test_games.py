@@ -1,4 +1,5 @@
 import polars as pl
+import pytest
 
 
 def test_prejebuckets() -> None:
@@ -55,3 +56,286 @@ def test_prejebuckets() -> None:
     (two_nobirb,) = (b.expr for b in buckets if b.difficulty == 2 and b.complexity == 0)
     assert pjeg.filter(two_birb).height == 2
     assert pjeg.filter(two_nobirb).height == 2
+
+
+def test_normalize_games() -> None:
+    from transformations.sugr.games import (
+        adversary_levels,
+        denormalize_games,
+        game_teams,
+        normalized_expansions,
+    )
+    from transformations.sugr.games import normalize_games as uut
+
+    adversaries = pl.LazyFrame(
+        {
+            "Adversary": ["A1", "A1", "A2", "Escalation", "Escalation"],
+            "Level": [1, 2, 1, None, None],
+            "Escalation": [None, None, None, "E1", "E2"],
+            "Expansion": [1, 1, 3, 2, 2],
+        },
+        schema_overrides={"Level": pl.UInt8},
+    )
+    combinations = pl.LazyFrame(
+        {
+            "Spirit_0": ["Thunderspeaker", "Thunderspeaker", "Hearth-Vigil"],
+            "Spirit_1": ["Hearth-Vigil", "Volcano Looming High", None],
+        },
+    )
+    games = pl.LazyFrame(
+        {
+            "Adversary": ["A1", "A1", "A2", "A1", "Escalation", "A1"],
+            "Level": [1, 1, 1, 2, None, 1],
+            "Escalation": [None, None, None, None, "E2", None],
+            "Expansion": [1, 3, 3, 3, 2, 1],
+            "Spirit_0": ["Thunderspeaker"] * 5 + ["Hearth-Vigil"],
+            "Spirit_1": [
+                "Hearth-Vigil",
+                "Hearth-Vigil",
+                "Volcano Looming High",
+                "Hearth-Vigil",
+                "Hearth-Vigil",
+                None,
+            ],
+        },
+        schema_overrides={"Level": pl.UInt8},
+    )
+
+    levels = adversary_levels(adversaries)
+    teams = game_teams(combinations)
+    assert levels.collect().height == 5
+    assert teams.collect().height == 3
+
+    normalized = uut(games, levels)
+    # The first two games only differ by expansion
+    assert normalized.collect().height == 5
+    assert normalized_expansions(normalized) == [1, 2, 3]
+
+    for e in [1, 2, 3]:
+        expected = games.filter(pl.col("Expansion").eq(e)).drop("Expansion")
+        actual = denormalize_games(normalized, teams, levels, e).select(
+            expected.collect_schema().names(),
+        )
+        assert sorted(actual.collect().rows(), key=str) == sorted(
+            expected.collect().rows(),
+            key=str,
+        )
+
+    # Unknown spirits aren't given another spirit's bit
+    unknown = pl.LazyFrame({"Spirit_0": ["Thunderspeaker"], "Spirit_1": ["Unknown"]})
+    with pytest.raises(pl.exceptions.InvalidOperationError):
+        game_teams(unknown).collect()
+
+
+def test_factorize_games() -> None:
+    from transformations.sugr.games import (
+        create_games,
+        filter_by_bucket,
+        je_buckets,
+        materialize_games,
+    )
+    from transformations.sugr.games import factorize_games as uut
+
+    adversaries = pl.LazyFrame(
+        {
+            "Expansion": [63] * 6,
+            "Adversary": ["A1", "A1", "A1", "A2", "A2", "A3"],
+            "Level": [0, 1, 2, 0, 1, 0],
+            "Matchup": ["Tier", "Tier", "Tier", "France", "France", "Tier"],
+            "Difficulty": [1, 2, 4, 2, 4, 1],
+            "Complexity": [0, 1, 1, 3, 3, 0],
+        },
+        schema_overrides={"Difficulty": pl.UInt8, "Complexity": pl.UInt8},
+    )
+    combos = pl.LazyFrame(
+        {
+            "Expansion": [63] * 8,
+            "Players": [2] * 8,
+            "Matchup": ["Tier"] * 4 + ["France"] * 4,
+            "Spirit_0": ["S1", "S1", "S2", "S3", "S1", "S1", "S2", "S3"],
+            "Spirit_1": ["S2", "S3", "S3", "S4", "S2", "S3", "S3", "S4"],
+            "Difficulty": [0.8, 1.0, 1.0, 1.2, 0.9, 1.15, 1.0, 1.3],
+            "Complexity": [1.0, 2.0, 2.0, 3.5, 1.0, 2.0, 2.0, 3.5],
+            "Has D": [False, False, False, False, False, False, False, True],
+        },
+    )
+
+    games = create_games(adversaries, combos)
+    factorized = uut(adversaries, combos)
+    # Games with the same adversary and team scores are only scored once
+    assert factorized.collect().height < games.collect().height
+
+    # Weighing the pairs by their games finds the same buckets
+    buckets = je_buckets(games)
+    assert [str(b) for b in je_buckets(factorized)] == [str(b) for b in buckets]
+    for bucket, weighed in zip(buckets, je_buckets(factorized), strict=True):
+        assert (
+            games.filter(bucket.expr).collect().height
+            == games.filter(weighed.expr).collect().height
+        )
+
+    total = 0
+    for bucket in buckets:
+        expected = filter_by_bucket(bucket, games).collect()
+        actual = materialize_games(
+            factorized.filter(bucket.expr),
+            adversaries,
+            combos,
+        ).select(expected.columns)
+        assert sorted(actual.collect().rows()) == sorted(expected.rows())
+        total += expected.height
+
+    assert total == games.filter(pl.col("Has D").not_()).collect().height
+
+
+def test_je_buckets_weighted() -> None:
+    from transformations.sugr.games import je_buckets as uut
+
+    weighed = pl.LazyFrame(
+        {
+            "Expansion": [63] * 12,
+            "Players": [2, 3, 4, 2] * 3,
+            "Has D": [False] * 11 + [True],
+            "Difficulty": [(i * 37 % 11) / 3 for i in range(12)],
+            "Complexity": [float(i * 5 % 7) for i in range(12)],
+            "Games": [1, 4, 2, 9, 1, 1, 3, 7, 2, 5, 1, 8],
+        },
+        schema_overrides={"Games": pl.UInt64},
+    )
+    repeated = weighed.select(pl.all().repeat_by("Games").explode()).drop("Games")
+
+    expected = uut(repeated)
+    actual = uut(weighed)
+    assert [str(b) for b in actual] == [str(b) for b in expected]
+    for e, a in zip(expected, actual, strict=True):
+        assert (
+            repeated.filter(e.expr).collect().height
+            == repeated.filter(a.expr).collect().height
+        )
+
+
+def test_bucket_games_counted() -> None:
+    from transformations.sugr.games import (
+        Scoring,
+        factorize_components,
+        game_components,
+    )
+    from transformations.sugr.games import bucket_games as uut
+
+    adversaries = pl.LazyFrame(
+        {
+            "Expansion": [15] * 3 + [63] * 3,
+            "Adversary": ["A1", "A1", "A2"] * 2,
+            "Level": [0, 1, 0] * 2,
+            "Matchup": ["Tier"] * 6,
+            "Difficulty": [1, 2, 3] * 2,
+            "Complexity": [0, 1, 3] * 2,
+        },
+        schema_overrides={"Difficulty": pl.UInt8, "Complexity": pl.UInt8},
+    )
+    combos = pl.LazyFrame(
+        {
+            "Expansion": [15] * 5 + [63] * 5,
+            "Players": [2, 2, 3, 3, 2] * 2,
+            "Matchup": ["Tier"] * 10,
+            "Spirit_0": ["S1", "S1", "S2", "S3", "S2"] * 2,
+            "Spirit_1": ["S2", "S3", "S3", "S4", "S4"] * 2,
+            "Difficulty": [0.8, 1.0, 1.1, 1.2, 1.0] * 2,
+            "Complexity": [1.0, 2.0, 2.5, 3.5, 2.0] * 2,
+            "Has D": [False] * 10,
+        },
+    )
+
+    scoring = Scoring(difficulty_quantiles=3, complexity_quantiles=3)
+    expected = uut(game_components(adversaries, combos), scoring)
+    # The counts of each pair of scores stand in for the games
+    actual = uut(factorize_components(adversaries, combos), scoring)
+    assert expected.keys() == actual.keys() == {15, 63}
+    for e in [15, 63]:
+        assert [str(b) for b in actual[e]] == [str(b) for b in expected[e]]
+        for a, b in zip(actual[e], expected[e], strict=True):
+            assert str(a.expr) == str(b.expr)
+
+
+def test_score_games() -> None:
+    from transformations.sugr.games import Scoring, game_components
+    from transformations.sugr.games import score_games as uut
+
+    adversaries = pl.LazyFrame(
+        {
+            "Expansion": [63, 63],
+            "Adversary": ["A1", "A2"],
+            "Matchup": ["Tier", "Tier"],
+            "Difficulty": [2, 3],
+            "Complexity": [1, 42],
+        },
+        schema_overrides={"Difficulty": pl.UInt8, "Complexity": pl.UInt8},
+    )
+    combos = pl.LazyFrame(
+        {
+            "Expansion": [63, 63],
+            "Players": [2, 2],
+            "Matchup": ["Tier", "Tier"],
+            "Spirit_0": ["S1", "S1"],
+            "Spirit_1": ["S2", "S3"],
+            "Difficulty": [1.5, 0.5],
+            # Moderate + Very High and Low + High
+            "Complexity": [22.5, 3.5],
+            "Has D": [False, False],
+        },
+    )
+
+    components = game_components(adversaries, combos)
+    default = uut(components).sort("Adversary", "Spirit_1").collect()
+    assert default.get_column("Difficulty").to_list() == [3.0, 1.0, 4.5, 1.5]
+    assert default.get_column("Complexity").to_list() == pytest.approx(
+        [23.7, 4.7, 72.9, 53.9],
+    )
+
+    retuned = (
+        uut(components, Scoring(complexity_weight=1.0, very_high=10))
+        .sort("Adversary", "Spirit_1")
+        .collect()
+    )
+    assert retuned.get_column("Difficulty").to_list() == [3.0, 1.0, 4.5, 1.5]
+    assert retuned.get_column("Complexity").to_list() == pytest.approx(
+        [7.5, 4.5, 16.5, 13.5],
+    )
+
+
+def test_score_games_fixed_point() -> None:
+    from transformations.sugr.games import Scoring
+    from transformations.sugr.games import score_games as uut
+
+    floating = pl.LazyFrame(
+        {
+            "Players": [2, 3, 1],
+            "Adversary Difficulty": [2, 3, 11],
+            "Adversary Complexity": [1, 42, 0],
+            "Team Difficulty": [1.05, 0.9, 1.3],
+            "Team Complexity": [22.5, 15.0, 6.0],
+        },
+        schema_overrides={
+            "Players": pl.UInt8,
+            "Adversary Difficulty": pl.UInt8,
+            "Adversary Complexity": pl.UInt8,
+        },
+    )
+    fixed = floating.with_columns(
+        pl.col("Team Difficulty").mul(6000).round(0).cast(pl.UInt16),
+        pl.col("Team Complexity").mul(60).round(0).cast(pl.UInt16),
+    )
+
+    for scoring in [Scoring(), Scoring(very_high=10)]:
+        expected = uut(floating, scoring).collect()
+        actual = uut(
+            fixed,
+            Scoring(very_high=scoring.very_high, fixed_point=True),
+        ).collect()
+        assert actual.schema["Difficulty"] == pl.UInt32
+        assert actual.get_column("Difficulty").to_list() == [
+            round(d * 6000) for d in expected.get_column("Difficulty")
+        ]
+        assert actual.get_column("Complexity").to_list() == [
+            round(c * 6000) for c in expected.get_column("Complexity")
+        ]
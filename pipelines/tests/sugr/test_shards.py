@@ -0,0 +1,11 @@
+def test_shard_ranges() -> None:
+    from transformations.sugr.shards import shard_ranges as uut
+
+    assert uut(10, 50, 100) == [(0, 10)]
+    assert uut(10, 250, 100) == [(0, 4), (4, 4), (8, 2)]
+    assert uut(0, 0, 100) == [(0, 0)]
+
+    for rows, cost in [(7, 7_000), (1_000, 999), (2_300_000, 13_800_000)]:
+        shards = uut(rows, cost, 1_000)
+        assert sum(length for (_, length) in shards) == rows
+        assert all(length * cost / rows <= 1_000 for (_, length) in shards)
@@ -2,10 +2,12 @@ import typing
 from itertools import combinations
 
 import polars as pl
+import polars.selectors as cs
 import pytest
 
 
 def test_spirits_by_expansion() -> None:
+    from transformations.sugr.expansions import slice_by_expansions
     from transformations.sugr.spirits import spirits_by_expansions as uut
 
     spirits = pl.LazyFrame(
@@ -17,9 +19,10 @@ def test_spirits_by_expansion() -> None:
         },
     )
 
-    results = uut(1 | 8, spirits).collect(streaming=True).to_dict(as_series=False)
+    sliced = slice_by_expansions([1 | 8], spirits).drop("Set")
+    results = uut(sliced).collect(streaming=True).to_dict(as_series=False)
 
-    # filters by expansion
+    # from the sliced spirits
     assert len(results["Spirit"]) == 4
     assert "S4" not in results["Spirit"]
 
@@ -64,6 +67,31 @@ def test_calculate_matchups() -> None:
                 pytest.fail(f"{s} isn't an expected spirit")
 
 
+def test_calculate_all_matchups() -> None:
+    from transformations.sugr.spirits import calculate_all_matchups as uut
+    from transformations.sugr.spirits import calculate_matchups
+
+    spirits = pl.LazyFrame(
+        {
+            "Spirit": ["S1", "S1", "S2", "S2", "S2", "S3", "S3", "S4", "S4"],
+            "Complexity": [1, 2, 2, 1, 3, 0, 0, 2, 2],
+            "Tier": ["A", "X", "S", "D", "S", "F", "F", "D", "C"],
+            "France": ["A", "A", "S", "D", "S", None, None, "D", "D"],
+        },
+    )
+
+    results = uut(["Tier", "France"], spirits).collect(streaming=True)
+    assert sorted(results.get_column("Matchup").unique().to_list()) == [
+        "France",
+        "Tier",
+    ]
+
+    for matchup in ["Tier", "France"]:
+        expected = calculate_matchups(matchup, spirits).collect(streaming=True)
+        actual = results.filter(pl.col("Matchup").eq(matchup)).drop("Matchup")
+        assert sorted(actual.rows()) == sorted(expected.rows())
+
+
 def test_generate_combinations() -> None:
     from transformations.sugr.spirits import generate_combinations as uut
 
@@ -136,3 +164,168 @@ def test_generate_combinations() -> None:
     assert m3["Difficulty"][0] == 3
     assert m3["Complexity"][0] == 5
     assert m3["Has D"][0]
+
+
+def test_generate_all_combinations() -> None:
+    from transformations.sugr.spirits import generate_all_combinations as uut
+    from transformations.sugr.spirits import generate_combinations as gc
+
+    spirits = [
+        "Thunderspeaker",
+        "Hearth-Vigil",
+        "Volcano Looming High",
+        "Ocean's Hungry Grasp",
+        "Lightning's Swift Strike",
+    ]
+    matchups = pl.LazyFrame(
+        {
+            "Spirit": spirits,
+            "Difficulty": [0.8, 1.3, 1.0, 1.15, 0.9],
+            "Complexity": [1, 3, 6, 42, 0],
+            "Has D": [False, True, False, False, False],
+        },
+        schema_overrides={"Difficulty": pl.Float32, "Complexity": pl.UInt8},
+    )
+
+    results = list(uut(4, matchups))
+    assert [pc for (pc, _) in results] == [1, 2, 3, 4]
+
+    for pc, combos in results:
+        expected = gc(
+            pc,
+            matchups,
+            pl.LazyFrame(
+                combinations(spirits, pc),
+                schema={f"Spirit_{p}": pl.String for p in range(pc)},
+                orient="row",
+            ),
+        ).collect()
+        actual = combos.collect()
+
+        assert actual.columns == expected.columns
+        assert actual.height == expected.height
+
+        key = [f"Spirit_{p}" for p in range(pc)]
+        joined = actual.join(
+            expected.with_columns(
+                pl.concat_list(key).list.sort().list.join("|").alias("key"),
+            ).drop(key),
+            left_on=pl.concat_list(key).list.sort().list.join("|"),
+            right_on="key",
+        )
+        assert joined.height == expected.height
+        for r in joined.rows(named=True):
+            assert r["Difficulty"] == pytest.approx(r["Difficulty_right"])
+            assert r["Complexity"] == pytest.approx(r["Complexity_right"])
+            assert r["Has D"] == r["Has D_right"]
+
+
+def test_generate_all_combinations_fixed_point() -> None:
+    from transformations.sugr.spirits import generate_all_combinations as gac
+    from transformations.sugr.spirits import generate_combinations as gc
+
+    spirits = ["Thunderspeaker", "Hearth-Vigil", "Volcano Looming High"]
+    matchups = pl.LazyFrame(
+        {
+            "Spirit": spirits,
+            "Difficulty": [0.8, 1.3, 1.15],
+            "Complexity": [1, 3, 42],
+            "Has D": [False, True, False],
+        },
+        schema_overrides={"Difficulty": pl.Float32, "Complexity": pl.UInt8},
+    )
+
+    for (pc, fixed), (_, floating) in zip(
+        gac(3, matchups, fixed_point=True),
+        gac(3, matchups),
+        strict=True,
+    ):
+        key = [f"Spirit_{p}" for p in range(pc)]
+        actual = fixed.sort(key).collect()
+        assert actual.schema["Difficulty"] == pl.UInt16
+        assert actual.schema["Complexity"] == pl.UInt16
+
+        expected = floating.sort(key).collect()
+        assert actual.get_column("Difficulty").to_list() == [
+            round(d * 6000) for d in expected.get_column("Difficulty")
+        ]
+        assert actual.get_column("Complexity").to_list() == [
+            round(c * 60) for c in expected.get_column("Complexity")
+        ]
+
+        single = gc(
+            pc,
+            matchups,
+            pl.LazyFrame(
+                combinations(spirits, pc),
+                schema=dict.fromkeys(key, pl.String),
+                orient="row",
+            ),
+            fixed_point=True,
+        )
+
+        def _scores(frame: pl.DataFrame, pc: int) -> list[tuple[typing.Any, ...]]:
+            return sorted(
+                (tuple(sorted(r[:pc])), *r[pc:])
+                for r in frame.select(
+                    cs.starts_with("Spirit_"),
+                    "Difficulty",
+                    "Complexity",
+                ).rows()
+            )
+
+        assert _scores(single.collect(), pc) == _scores(actual, pc)
+
+
+def test_generate_lattice_combinations() -> None:
+    from transformations.sugr.spirits import combinations_for_expansion
+    from transformations.sugr.spirits import generate_all_combinations as gac
+    from transformations.sugr.spirits import generate_lattice_combinations as uut
+
+    matchups = pl.LazyFrame(
+        {
+            "Expansion": [1, 1, 1, 3, 3, 3, 3, 7, 7, 7, 7, 7],
+            "Spirit": [
+                "Thunderspeaker",
+                "Hearth-Vigil",
+                "Volcano Looming High",
+                "Thunderspeaker",
+                "Hearth-Vigil",
+                "Volcano Looming High",
+                "Ocean's Hungry Grasp",
+                "Thunderspeaker",
+                "Hearth-Vigil",
+                "Volcano Looming High",
+                "Ocean's Hungry Grasp",
+                "Lightning's Swift Strike",
+            ],
+            "Difficulty": [
+                1.0,
+                1.3,
+                1.0,
+                0.8,
+                1.3,
+                1.0,
+                1.15,
+                0.8,
+                1.3,
+                0.9,
+                1.15,
+                1.0,
+            ],
+            "Complexity": [1, 3, 6, 1, 3, 6, 42, 1, 3, 6, 42, 0],
+            "Has D": [False, True, False] * 4,
+        },
+        schema_overrides={"Difficulty": pl.Float32, "Complexity": pl.UInt8},
+    )
+
+    lattice = dict(uut(3, matchups))
+    assert list(lattice.keys()) == [1, 2, 3]
+
+    for e in [1, 3, 7]:
+        expected = dict(
+            gac(3, matchups.filter(pl.col("Expansion").eq(e)).drop("Expansion")),
+        )
+        for pc, combos in lattice.items():
+            actual = combinations_for_expansion(e, combos).collect()
+            assert sorted(actual.rows()) == sorted(expected[pc].collect().rows())
@@ -329,3 +329,85 @@ def test_partitions() -> None:
         assert partitions[3]["key1"] == 11
         assert partitions[3]["key2"] == 22
         assert partitions[3]["key3"] == 34
+
+
+def test_partitions_typed(tmp_path: Path) -> None:
+    dataset = uut(tmp_path, "test", Type=pl.String, Players=pl.UInt8)  # type: ignore[reportArgumentType]
+    dataset.write(
+        pl.LazyFrame(
+            {
+                "Type": ["6B", "6B", "6B", "Coastal", "6B"],
+                "Players": [10, 2, 2, 1, 10],
+                "Value": [1, 2, 3, 4, 5],
+            },
+        ),
+    )
+    dataset.write(pl.LazyFrame({"Value": [6]}), Type="6B", Players=2)
+
+    # Typed by the schema, so numbers sort as numbers
+    assert dataset.partitions() == [
+        {"Type": "6B", "Players": 2},
+        {"Type": "6B", "Players": 10},
+        {"Type": "Coastal", "Players": 1},
+    ]
+    assert [dataset.rows(**p) for p in dataset.partitions()] == [3, 2, 1]
+    assert dataset.rows() == 6
+    assert dataset.rows(Type="Missing") == 0
+    assert uut(tmp_path, "missing", Key=pl.UInt8).partitions() == []  # type: ignore[reportArgumentType]
+
+
+def test_write_unsinkable() -> None:
+    from flows.utilities.memory_budget import MemoryBudget
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dataset = uut(tmpdir, str(uuid4()), int=pl.Int64)  # type: ignore[reportArgumentType]
+
+        # Horizontal operations can't be sunk as of 1.2.1
+        frame = WriteCases.frame.lazy().with_columns(
+            pl.max_horizontal("int", pl.lit(3)).alias("max"),
+        )
+        dataset.write(frame)
+        dataset.write(frame, budget=MemoryBudget.from_mib(1), estimate=1 << 30)
+
+        assert dataset.read().collect().height == WriteCases.frame.height * 2
+        assert dataset.size() > dataset.size(int=5) > 0
+        assert dataset.size(int=3) == 0
+
+
+def test_null_columns() -> None:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dataset = uut(tmpdir, str(uuid4()), key=pl.Int8)  # type: ignore[reportArgumentType]
+
+        dataset.write(
+            pl.LazyFrame(
+                {
+                    "key": [1, 1, 2],
+                    "some-nulls": [1, None, None],
+                    "all-nulls": [None, None, None],
+                },
+                schema_overrides={"all-nulls": pl.String},
+            ),
+        )
+        # Columns missing from a file are read as nulls
+        dataset.write(pl.LazyFrame({"missing": [None, 1]}), key=1)
+
+        assert sorted(dataset.null_columns()) == ["all-nulls"]  # type: ignore[reportArgumentType]
+        assert sorted(dataset.null_columns(key=1)) == ["all-nulls"]  # type: ignore[reportArgumentType]
+        assert sorted(dataset.null_columns(key=2)) == ["all-nulls", "some-nulls"]  # type: ignore[reportArgumentType]
+        assert dataset.null_columns(key=3) == []
+
+        # The statistics match scanning for the null columns
+        for key in [1, 2]:
+            frame = dataset.read(key=key).collect()
+            assert sorted(
+                c for c in frame.columns if frame[c].null_count() == frame.height
+            ) == sorted(dataset.null_columns(key=key))  # type: ignore[reportArgumentType]
+
+        # Without statistics the null columns can't be known
+        path = Path(tmpdir) / dataset.path().name / "key=3" / "stats.parquet"
+        path.parent.mkdir()
+        pl.DataFrame({"a": [None]}, schema={"a": pl.Int8}).write_parquet(
+            path,
+            statistics=False,
+        )
+        assert dataset.null_columns(key=3) is None
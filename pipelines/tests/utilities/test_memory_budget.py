@@ -0,0 +1,68 @@
+import os
+
+import polars as pl
+
+from flows.utilities.memory_budget import MemoryBudget as uut
+from flows.utilities.memory_budget import Strategy
+
+
+def test_strategy() -> None:
+    budget = uut.from_mib(100)
+    assert budget.strategy(None) == Strategy.STREAMING
+    assert budget.strategy(10 << 20) == Strategy.IN_MEMORY
+    assert budget.strategy(50 << 20) == Strategy.STREAMING
+    assert budget.strategy(250 << 20) == Strategy.SPILL
+    assert budget.strategy(250 << 20, chunkable=True) == Strategy.CHUNKED
+
+    assert not budget.low_memory(10 << 20)
+    assert budget.low_memory(50 << 20)
+    assert budget.chunks(50 << 20) == 1
+    assert budget.chunks(250 << 20) == 3
+
+    # Without a budget everything is streamed
+    unbounded = uut()
+    assert unbounded.strategy(1 << 40) == Strategy.STREAMING
+    assert unbounded.low_memory(0)
+    assert unbounded.chunks(1 << 40) == 1
+
+
+def test_collect(tmp_path: str) -> None:
+    budget = uut.from_mib(1, tmp_path)
+    frame = pl.LazyFrame({"a": [1, 2, 2], "b": [1, 2, 3]}).group_by("a").agg("b")
+
+    ooc = os.environ.get("POLARS_FORCE_OOC")
+    for estimate in [None, 0, 1 << 30]:
+        assert budget.collect(frame, estimate).sort("a").height == 2
+        assert os.environ.get("POLARS_FORCE_OOC") == ooc
+
+    assert budget.record("test") > 0
+
+
+def test_map() -> None:
+    import threading
+    import time
+
+    running: list[int] = []
+    peak: list[int] = []
+    lock = threading.Lock()
+
+    def _fn(estimate: int) -> int:
+        with lock:
+            running.append(estimate)
+            peak.append(sum(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(estimate)
+        return estimate * 2
+
+    # Results are in order, at most the budget's estimated bytes run at once
+    estimates = [40, 30, 30, 20, 10, 200, 10]
+    budget = uut(100)
+    assert budget.map(_fn, estimates, list(estimates), 4) == [e * 2 for e in estimates]
+    assert max(p for p in peak if p < 200) <= 100
+    assert 200 in peak
+
+    # Without a budget only the workers bound it
+    peak.clear()
+    assert uut().map(_fn, estimates, list(estimates), 2) == [e * 2 for e in estimates]
+    assert len(peak) == len(estimates)
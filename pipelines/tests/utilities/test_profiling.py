@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import polars as pl
+
+from flows.utilities import profiling as uut
+from flows.utilities.hive_dataset import HiveDataset
+from flows.utilities.memory_budget import MemoryBudget
+
+
+def test_capture(tmp_path: Path) -> None:
+    ds = HiveDataset(tmp_path, "test", Key=pl.UInt8)  # type: ignore [argumentType]
+    frame = pl.LazyFrame({"Key": [1, 1, 2], "Value": [1, 2, 3]})
+
+    # Nothing is captured unless it's enabled
+    ds.write(frame)
+    assert not (tmp_path / "profiles").exists()
+
+    uut.enable(tmp_path / "profiles")
+    try:
+        ds.write(frame.drop("Key"), Key=3)
+        MemoryBudget.from_mib(1).collect(frame.group_by("Key").len(), 0)
+    finally:
+        uut.enable(None)
+
+    (write_plan, collect_plan) = sorted((tmp_path / "profiles").glob("*.plan.txt"))
+    assert write_plan.name.endswith("-test.plan.txt")
+    assert "STREAMING" in write_plan.read_text()
+    assert collect_plan.name.endswith("-collect.plan.txt")
+    assert "STREAMING" not in collect_plan.read_text()
+
+    profiles = sorted((tmp_path / "profiles").glob("*.profile.parquet"))
+    assert len(profiles) == 2
+    assert pl.read_parquet(profiles[1]).columns == ["node", "start", "end"]
@@ -0,0 +1,62 @@
+import os
+
+import polars as pl
+import pytest
+
+from flows.utilities.threads import allocate_threads as uut
+from flows.utilities.threads import distribute, use_threads
+
+
+@pytest.mark.parametrize(
+    ("sizes", "concurrency", "expected"),
+    [
+        ([], 4, []),
+        ([10, 10, 10, 10], 4, [4, 4, 4, 4]),
+        ([10, 10], 4, [8, 8]),
+        ([1, 1, 1, 37], 4, [1, 1, 1, 15]),
+        ([0, 1000], 2, [1, 16]),
+        ([0, 0], 32, [8, 8]),
+    ],
+)
+def test_allocate_threads(
+    sizes: list[int],
+    concurrency: int,
+    expected: list[int],
+) -> None:
+    assert uut(sizes, concurrency, cpus=16) == expected
+
+
+@pytest.mark.parametrize(
+    ("sizes", "per_task", "expected"),
+    [
+        ([], 4, []),
+        ([1, 1, 1], 4, [[0, 1, 2]]),
+        ([1, 2, 3, 4], 2, [[0, 3], [1, 2]]),
+        ([10, 1, 1, 1, 1, 1], 3, [[0], [1, 2, 3, 4, 5]]),
+    ],
+)
+def test_distribute(
+    sizes: list[int],
+    per_task: int,
+    expected: list[list[int]],
+) -> None:
+    assert distribute(sizes, per_task) == expected
+
+
+def test_use_threads(
+    monkeypatch: pytest.MonkeyPatch,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    monkeypatch.delenv("POLARS_MAX_THREADS", raising=False)
+    monkeypatch.delenv("RAYON_NUM_THREADS", raising=False)
+    use_threads(3, "test")
+    assert os.environ["POLARS_MAX_THREADS"] == "3"
+    assert os.environ["RAYON_NUM_THREADS"] == "3"
+
+    # The pool has started by now, so it can't be resized
+    size = pl.thread_pool_size()
+    capsys.readouterr()
+    use_threads(size + 1, "test")
+    out = capsys.readouterr().out
+    assert f"already started with {size} threads, not {size + 1}" in out
+    assert f"using {size} of" in out
@@ -0,0 +1,35 @@
+import polars as pl
+
+from flows.utilities import tracing as uut
+from flows.utilities.hive_dataset import HiveDataset
+from flows.utilities.memory_budget import MemoryBudget
+
+
+def test_span() -> None:
+    recorded = len(uut.events())
+    with uut.span("outer", "step", task="a/1/2"), uut.span("inner", "read") as args:
+        args["rows"] = 3
+
+    (inner, outer) = uut.events()[recorded:]
+    assert (inner["name"], inner["cat"], inner["ph"]) == ("inner", "read", "X")
+    assert inner["args"]["rows"] == 3
+    assert outer["args"]["task"] == "a/1/2"
+    assert outer["args"]["peak_rss"] > 0
+    assert outer["ts"] <= inner["ts"]
+    assert outer["ts"] + outer["dur"] >= inner["ts"] + inner["dur"]
+
+
+def test_hive_dataset_spans(tmp_path: str) -> None:
+    ds = HiveDataset(tmp_path, "test", Key=pl.UInt8)  # type: ignore [argumentType]
+
+    recorded = len(uut.events())
+    ds.write(pl.LazyFrame({"Key": [1, 1, 2], "Value": [1, 2, 3]}))
+    # Lazy reads aren't traced, the rows are when the plan is collected
+    MemoryBudget().collect(ds.read(Key=1))
+
+    (write, collect) = uut.events()[recorded:]
+    assert (write["name"], write["cat"]) == ("test", "write")
+    assert (write["args"]["files"], write["args"]["rows"]) == (2, 3)
+    assert write["args"]["bytes"] == ds.size()
+    assert (collect["cat"], collect["args"]["rows"]) == ("collect", 2)
+    assert collect["args"]["strategy"] == "streaming"
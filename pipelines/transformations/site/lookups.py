@@ -0,0 +1,51 @@
+"""Provides keyed lookups of the inputs the site shows alongside each game."""
+
+import typing
+
+import polars as pl
+
+# Spirits without an aspect are shown as their base spirit
+_base_aspect = "Base"
+
+
+def adversary_lookup(
+    adversaries: pl.LazyFrame,
+) -> dict[str, dict[str, tuple[typing.Any, str]]]:
+    """Looks up the (Difficulty, Matchup) of an adversary's Name and Level."""
+    lookup: dict[str, dict[str, tuple[typing.Any, str]]] = {}
+    for name, level, difficulty, matchup in (
+        adversaries.clone()
+        .select("Name", "Level", "Difficulty", "Matchup")
+        .collect(streaming=True)
+        .iter_rows()
+    ):
+        lookup.setdefault(name, {})[str(level)] = (difficulty, matchup)
+
+    return lookup
+
+
+def spirit_lookup(
+    spirits: pl.LazyFrame,
+    adversaries: pl.LazyFrame,
+) -> dict[str, dict[str, dict[str, str]]]:
+    """Looks up the rating of a spirit's Aspect for each of the adversary Matchups."""
+    matchups = (
+        adversaries.clone()
+        .select(pl.col("Matchup").unique(maintain_order=True))
+        .collect(streaming=True)
+        .to_series()
+        .to_list()
+    )
+
+    lookup: dict[str, dict[str, dict[str, str]]] = {}
+    for row in (
+        spirits.clone()
+        .select("Name", pl.col("Aspect").fill_null(_base_aspect), *matchups)
+        .collect(streaming=True)
+        .iter_rows(named=True)
+    ):
+        lookup.setdefault(row["Name"], {})[row["Aspect"]] = {
+            m: row[m] for m in matchups
+        }
+
+    return lookup
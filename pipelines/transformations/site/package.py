@@ -1,76 +1,285 @@
 """Provides operations on LazyFrames useful for packaging them for the web."""
 
-import gc
+import bisect
+import contextlib
+import hashlib
+import io
+import json
+import random
 import typing
+from dataclasses import dataclass
+from pathlib import Path
 
 import polars as pl
+import pyarrow as pa
 
+# Maps the site's inputs and partitions to their content-addressed files,
+# the only file of the site which isn't immutable
+MANIFEST = "manifest.json"
+# The manifest it replaced, pages keep the manifest they loaded
+PREVIOUS_MANIFEST = "manifest.previous.json"
+# Digest characters in content-addressed file names
+_digest = 16
+# Part of every partition's fingerprint, bump it whenever package (or encode
+# and write_feather) changes what it writes for the same frame and arguments
+PACKAGE_FORMAT = 1
 
-def drop_nulls(frame: pl.LazyFrame) -> pl.LazyFrame:
-    """Removes any columns only containing null values."""
-    nulls = (
+
+def drop_nulls(frame: pl.LazyFrame, nulls: list[str] | None = None) -> pl.LazyFrame:
+    """Removes any columns only containing null values.
+
+    Args:
+        frame: The frame to remove the columns from.
+        nulls: The null columns if they're already known (i.e. from statistics),
+            otherwise they're found by scanning the frame.
+    """
+    if nulls is not None:
+        return frame.clone().drop(nulls)
+
+    all_nulls = (
         frame.clone().select(pl.all().is_null().all()).unpivot().filter(pl.col("value"))
     )
-    null_cols = [r[0] for r in nulls.collect(streaming=True).rows()]
-    del nulls
-    gc.collect()
+    null_cols = [r[0] for r in all_nulls.collect(streaming=True).rows()]
 
     return frame.clone().drop(null_cols)
 
 
-def batch(
+@dataclass(frozen=True)
+class Packaged:
+    """Represents a partition packaged into content-addressed files."""
+
+    # Name of the partition's manifest, listing its files and their first rows
+    manifest: str
+    rows: int
+    # Bytes in memory and written, None when the partition was unchanged
+    plain_bytes: int | None = None
+    written_bytes: int | None = None
+
+
+def package(
     frame: pl.LazyFrame,
-    size: int = 10_000,
-) -> typing.Iterator[tuple[tuple[int, int], pl.LazyFrame]]:
-    """Batches the frame, 'size' rows at a time."""
-    all_records = frame.clone().with_row_index()
-
-    last_idx = 0
-    more = True
-    while more:
-        next_idx = last_idx + size
-        batch = all_records.clone().filter(
-            pl.Expr.and_(
-                pl.col("index").ge(last_idx),
-                pl.col("index").lt(next_idx),
-            ),
+    path: Path,
+    *,
+    rows: int = 10_000,
+    size: int = 4 << 20,
+    compression: str | None = None,
+) -> Packaged:
+    """Writes the frame to feather files of at most rows rows and size bytes.
+
+    The frame is only collected once and each file is written straight from
+    its consecutive record batches. Files are named after their first row
+    and the digest of their contents, so a name always has the same contents.
+    The files and their first rows are listed in the partition's manifest,
+    named after a fingerprint of the frame, arguments and PACKAGE_FORMAT. A
+    partition already packaged with the same fingerprint isn't rewritten.
+    Nothing is removed, see publish.
+
+    Args:
+        frame: The frame to package, its order must be deterministic.
+        path: Directory to write the feather files to.
+        rows: Maximum rows of a file.
+        size: Target bytes of a file, based on the average width of the rows.
+        compression: lz4 or zstd to compress the files' buffers with.
+    """
+    collected = frame.collect(streaming=True)
+    hashes = io.BytesIO()
+    collected.hash_rows().to_frame().write_ipc(hashes)
+    fingerprint = hashlib.sha256(
+        json.dumps(
+            [PACKAGE_FORMAT, str(collected.schema), rows, size, compression],
+        ).encode()
+        + hashes.getvalue(),
+    ).hexdigest()
+
+    manifest = path / f"manifest.{fingerprint[:_digest]}.json"
+    if manifest.exists():
+        return Packaged(
+            manifest.name,
+            json.loads(manifest.read_text(encoding="utf-8"))["rows"],
+        )
+
+    table = collected.to_arrow()
+    width = max(1, table.nbytes // max(table.num_rows, 1))
+    length = max(1, min(rows, size // width))
+
+    encoded = encode(table)
+    written = 0
+    files = []
+    # Empty frames still get a file so their schema is available
+    offsets = list(range(0, max(table.num_rows, 1), length))
+    for start in offsets:
+        written += write_feather(
+            encoded.slice(start, length),
+            path / f"{start}.feather",
+            compression,
         )
+        files.append(content_address(path / f"{start}.feather").name)
+
+    with replacing(manifest) as staged:
+        staged.write_text(
+            json.dumps({"rows": table.num_rows, "files": files, "offsets": offsets}),
+            encoding="utf-8",
+        )
+
+    return Packaged(manifest.name, table.num_rows, table.nbytes, written)
+
+
+def content_address(path: Path) -> Path:
+    """Renames the file to include the digest of its contents before its suffix."""
+    with path.open("rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()[:_digest]
+
+    return path.replace(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+def publish(
+    path: Path,
+    inputs: dict[str, str],
+    partitions: dict[str, str],
+) -> list[Path]:
+    """Points the site's manifest at the files given and removes older files.
+
+    The manifest is replaced atomically. The one it replaces is kept as
+    PREVIOUS_MANIFEST, since pages which already loaded it keep reading
+    its files. Only the files neither manifest refers to, from earlier
+    runs and partitions which disappeared, are removed.
+
+    Args:
+        path: The root of the site's data.
+        inputs: The content-addressed files of the inputs by their names.
+        partitions: The names of the partitions' manifests by their paths,
+            relative to path.
+
+    Returns:
+        The removed files.
+    """
+    current = {"inputs": inputs, "partitions": partitions}
+    previous = (
+        json.loads((path / MANIFEST).read_text(encoding="utf-8"))
+        if (path / MANIFEST).exists()
+        else None
+    )
+    if previous is not None:
+        with replacing(path / PREVIOUS_MANIFEST) as staged:
+            staged.write_text(json.dumps(previous), encoding="utf-8")
+
+    with replacing(path / MANIFEST) as staged:
+        staged.write_text(json.dumps(current), encoding="utf-8")
 
-        rem = batch.select("index").collect(streaming=True).height
-        yield ((last_idx, last_idx + rem), batch.clone().drop("index"))
+    referenced = {path / MANIFEST, path / PREVIOUS_MANIFEST}
+    for manifest in [current, previous]:
+        if manifest is not None:
+            referenced.update(_referenced(path, manifest))
 
-        last_idx = next_idx
-        more = size == rem
-        del batch
-        gc.collect()
+    removed = [f for f in path.rglob("*") if f.is_file() and f not in referenced]
+    for f in removed:
+        f.unlink()
 
-    del all_records
-    gc.collect()
+    # Directories left empty, deepest first
+    for directory in sorted(path.rglob("*"), key=lambda d: len(d.parts), reverse=True):
+        if directory.is_dir() and not any(directory.iterdir()):
+            directory.rmdir()
+
+    return removed
+
+
+def _referenced(path: Path, manifest: dict[str, dict[str, str]]) -> set[Path]:
+    referenced = {path / f for f in manifest["inputs"].values()}
+    for partition, name in manifest["partitions"].items():
+        referenced.add(path / partition / name)
+        files = json.loads(
+            (path / partition / name).read_text(encoding="utf-8"),
+        )["files"]
+        referenced.update(path / partition / f for f in files)
+
+    return referenced
+
+
+@contextlib.contextmanager
+def replacing(path: Path) -> typing.Iterator[Path]:
+    """Yields a staging path which atomically replaces path once written."""
+    staged = path.with_name(f".{path.name}.tmp")
+    try:
+        yield staged
+        staged.replace(path)
+    finally:
+        staged.unlink(missing_ok=True)
+
+
+def pick(
+    manifest: Path,
+    rng: random.Random | None = None,
+) -> dict[str, typing.Any] | None:
+    """Picks a uniformly random row of a packaged partition.
+
+    Only the partition's manifest and the one file containing the row are read.
+    None when the partition is empty.
+    """
+    listing = json.loads(manifest.read_text(encoding="utf-8"))
+    if listing["rows"] == 0:
+        return None
+
+    row = (rng or random).randrange(listing["rows"])
+    f = bisect.bisect_right(listing["offsets"], row) - 1
+    return pl.read_ipc(manifest.parent / listing["files"][f]).row(
+        row - listing["offsets"][f],
+        named=True,
+    )
+
+
+def encode(table: pa.Table) -> pa.Table:
+    """Dictionary encodes the string columns, i.e. the names repeated every row.
+
+    Every slice of the encoded table shares a dictionary with the smallest
+    indices fitting it.
+    """
+    columns = []
+    for column in table.combine_chunks().columns:
+        if not pa.types.is_large_string(column.type):
+            columns.append(column)
+            continue
+
+        encoded = column.dictionary_encode()
+        values = max((len(c.dictionary) for c in encoded.chunks), default=0)
+        index = next(
+            i for i in [pa.int8(), pa.int16(), pa.int32()] if values <= _max_index(i)
+        )
+        columns.append(encoded.cast(pa.dictionary(index, column.type)))
+
+    return pa.table(columns, names=table.column_names)
+
+
+def write_feather(table: pa.Table, path: Path, compression: str | None = None) -> int:
+    """Writes the table's record batches to a feather file and returns its bytes."""
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with (
+        replacing(path) as staged,
+        pa.ipc.new_file(staged, table.schema, options=options) as writer,
+    ):
+        for record_batch in table.to_batches():
+            writer.write_batch(record_batch)
+
+    return path.stat().st_size
+
+
+def _max_index(index: pa.DataType) -> int:
+    return (1 << (index.bit_width - 1)) - 1
 
 
 def sample(
     frame: pl.LazyFrame,
     samples: int = 100_000,
+    seed: int = 0,
 ) -> pl.LazyFrame:
-    """Reduces the frame to the length of samples."""
-    if samples in [0, 1, 2]:
-        return frame.head(samples)
-
-    rows = frame.select(pl.len()).collect(streaming=True).item(0, 0)
-    gc.collect()
-
-    if rows <= samples:
-        return frame
-
-    # We want to randomly sample the whole frame
-    # instead of just the back part after an offset
-    # This gets close with a chunk skipped in the middle but it will be smallish.
-    (n_extra, extra) = divmod(rows, samples)
-    (n_sample, offset) = divmod(rows - extra, samples - (extra // n_extra))
-
-    return pl.concat(
-        [
-            frame.clone().head(extra).gather_every(n_extra),
-            frame.clone().gather_every(n_sample, extra + offset),
-        ],
-    ).head(samples)
+    """Uniformly samples up to samples rows of the frame in a single pass.
+
+    Rows are picked by the smallest seeded hashes of their values,
+    so the same rows are picked across runs regardless of the frame's order.
+    The sample is ordered by the hashes, any slice of it is also uniform.
+    """
+    key = "__sample_key"
+    return (
+        frame.with_columns(pl.struct(pl.all()).hash(seed).alias(key))
+        .bottom_k(samples, by=key)
+        .drop(key)
+    )
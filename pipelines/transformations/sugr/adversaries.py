@@ -6,11 +6,13 @@ import polars as pl
 
 
 def adversaries_by_expansions(
-    expansions: int,
     adversaries: pl.LazyFrame,
     escalations: pl.LazyFrame,
 ) -> tuple[pl.LazyFrame, list[str]]:
-    """Filter and clean Adversary data and Matchup data.
+    """Clean Adversary data and Matchup data of a set of expansions.
+
+    The adversaries and escalations must already be sliced to the set,
+    see slice_by_expansions (the escalations with disjoint).
 
     With three or fewer adveraries the list will be padded with additional
     escalations based on adversaries not already included.
@@ -19,7 +21,6 @@ def adversaries_by_expansions(
     """
     adversaries = (
         adversaries.clone()
-        .filter(pl.col("Expansion").or_(expansions).eq_missing(expansions))
         .drop("Expansion")
         .with_columns(
             [
@@ -42,11 +43,7 @@ def adversaries_by_expansions(
             [
                 adversaries,
                 (
-                    escalations.filter(
-                        pl.col("Expansion").and_(expansions).eq_missing(0),
-                    )
-                    .drop("Expansion")
-                    .with_columns(
+                    escalations.drop("Expansion").with_columns(
                         [
                             pl.lit("Escalation").alias("Name"),
                             pl.lit(1).cast(pl.UInt8).alias("Difficulty"),
@@ -0,0 +1,189 @@
+"""Provides estimates of the rows and sizes of the games pipeline's partitions."""
+
+import math
+import typing
+
+import polars as pl
+
+from transformations.sugr.adversaries import adversaries_by_expansions
+from transformations.sugr.expansions import expansions_and_players, slice_by_expansions
+from transformations.sugr.spirits import calculate_all_matchups, spirits_by_expansions
+
+if typing.TYPE_CHECKING:
+    from transformations.sugr.games import Scoring
+
+
+def estimate_games(  # noqa: PLR0913
+    expansions: pl.LazyFrame,
+    adversaries: pl.LazyFrame,
+    escalations: pl.LazyFrame,
+    spirits: pl.LazyFrame,
+    *,
+    subset: bool = False,
+    max_players: int = 6,
+    scoring: "Scoring | None" = None,
+) -> pl.DataFrame:
+    """Estimates every intermediate partition of the games pipeline.
+
+    Only the (small) inputs and matchups are calculated, the sizes of the
+    combinations and games are counted with combinatorics instead of joins.
+    Rows are exact, Bytes are based on the average widths of the names and
+    Memory is a rough peak for the task producing the partition.
+
+    Args:
+        expansions: The expansions input.
+        adversaries: The adversaries input.
+        escalations: The escalations input.
+        spirits: The spirits input.
+        subset: Same as the games flow's subset parameter.
+        max_players: Same as the games flow's player-limit parameter.
+        scoring: Scoring with the number of je buckets.
+    """
+    je_buckets = (
+        (scoring.difficulty_quantiles, scoring.complexity_quantiles)
+        if scoring is not None
+        else (5, 5)
+    )
+
+    sets = expansions_and_players(expansions, subset=subset, max_players=max_players)
+    # Cross joins aren't supported by streaming as of 1.2.1, the inputs are small
+    (set_adversaries, set_escalations, set_spirits) = (
+        slice_by_expansions([exp for (exp, _) in sets], frame, disjoint=disjoint)
+        .collect()
+        .lazy()
+        for (frame, disjoint) in [
+            (adversaries, False),
+            (escalations, True),
+            (spirits, False),
+        ]
+    )
+
+    def _set(frame: pl.LazyFrame, exp: int) -> pl.LazyFrame:
+        return frame.clone().filter(pl.col("Set").eq(exp)).drop("Set")
+
+    estimates: list[tuple[str, int, int | None, str | None, int, int]] = []
+    for exp, players in sets:
+        (exp_adversaries, matchups) = adversaries_by_expansions(
+            _set(set_adversaries, exp),
+            _set(set_escalations, exp),
+        )
+        levels = dict(
+            exp_adversaries.group_by("Matchup").len().collect(streaming=True).rows(),
+        )
+        adversary_width = _string_width(exp_adversaries, "Adversary")
+
+        exp_spirits = spirits_by_expansions(_set(set_spirits, exp))
+        spirit_width = _string_width(exp_spirits, "Spirit")
+        ratings = dict(
+            calculate_all_matchups(matchups, exp_spirits)
+            .group_by("Matchup")
+            .len()
+            .collect(streaming=True)
+            .rows(),
+        )
+
+        # Difficulty, Complexity and Has D
+        scores = 8 + 8 + 1
+        for m in matchups:
+            estimates.append(
+                ("matchups", exp, None, m, ratings[m], ratings[m] * (spirit_width + 6)),
+            )
+            estimates.extend(
+                (
+                    "combinations",
+                    exp,
+                    pc,
+                    m,
+                    math.comb(ratings[m], pc),
+                    math.comb(ratings[m], pc) * (pc * spirit_width + scores),
+                )
+                for pc in players
+            )
+
+        (d_quantiles, c_quantiles) = je_buckets
+        buckets = 1 if exp == 2 else 6 if exp < 17 else d_quantiles * (c_quantiles - 2)
+        for pc in players:
+            games = sum(math.comb(ratings[m], pc) * levels[m] for m in matchups)
+            # Adversary, Level and Escalation
+            width = pc * spirit_width + scores + adversary_width + 1 + 16
+            estimates.append(("games", exp, pc, None, games, games * width))
+            estimates.append(
+                (
+                    "bucket",
+                    exp,
+                    pc,
+                    None,
+                    math.ceil(games / buckets),
+                    math.ceil(games / buckets) * width,
+                ),
+            )
+
+    return pl.DataFrame(
+        estimates,
+        schema={
+            "Stage": pl.String,
+            "Expansion": pl.UInt8,
+            "Players": pl.UInt8,
+            "Matchup": pl.String,
+            "Rows": pl.UInt64,
+            "Bytes": pl.UInt64,
+        },
+        orient="row",
+    ).with_columns(
+        # Joins hold their inputs alongside their output
+        pl.col("Bytes").mul(2).alias("Memory"),
+    )
+
+
+def estimate(
+    estimates: pl.DataFrame,
+    stage: str,
+    **kwargs: typing.Any,
+) -> tuple[int, int, int]:
+    """Sums the Rows, Bytes and Memory of the matching partitions of a stage."""
+    (rows, size, memory) = (
+        estimates.filter(pl.col("Stage").eq(stage), **kwargs)
+        .select(pl.col("Rows", "Bytes", "Memory").sum())
+        .row(0)
+    )
+    return (rows, size, memory)
+
+
+def _string_width(frame: pl.LazyFrame, column: str) -> int:
+    # Strings longer than 12 bytes are stored after a 16 byte view
+    return 16 + math.ceil(
+        frame.select(pl.col(column).str.len_bytes().mean())
+        .collect(streaming=True)
+        .item()
+        or 0,
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    from pathlib import Path
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("input", type=Path)
+    parser.add_argument("--player-limit", type=int, default=6)
+    parser.add_argument("--subset", action="store_true")
+    args = parser.parse_args()
+
+    report = estimate_games(
+        *(
+            pl.scan_csv(args.input / f"{tsv}.tsv", separator="\t")
+            for tsv in ["expansions", "adversaries", "escalations", "spirits"]
+        ),
+        subset=args.subset,
+        max_players=args.player_limit,
+    )
+
+    with pl.Config(tbl_rows=-1, thousands_separator=True):
+        print(  # noqa: T201
+            report.group_by("Stage", maintain_order=True).agg(
+                pl.len().alias("Partitions"),
+                pl.col("Rows", "Bytes").sum(),
+                pl.col("Memory").max().alias("Peak Memory"),
+            ),
+        )
+        print(report.filter(pl.col("Stage").eq("bucket")).top_k(10, by="Memory"))  # noqa: T201
@@ -22,6 +22,38 @@ def expansions_and_players(
     return [(exp, list(range(1, min(p, max_players) + 1))) for (exp, p) in values]
 
 
+def slice_by_expansions(
+    expansions: list[int],
+    frame: pl.LazyFrame,
+    *,
+    disjoint: bool = False,
+) -> pl.LazyFrame:
+    """Slices the frame to the rows valid for each set of expansions at once.
+
+    Rows are valid when their Expansion bitmask is contained in the set,
+    or when disjoint, when they share no expansions with the set.
+    Each valid row is repeated for every set it's valid for, in a Set column.
+    """
+    sets = pl.LazyFrame({"Set": expansions}, schema={"Set": pl.UInt8})
+    mask = pl.col("Expansion").cast(pl.UInt64)
+    expansion = pl.col("Set").cast(pl.UInt64)
+    valid = (
+        mask.and_(expansion).eq_missing(0)
+        if disjoint
+        else mask.or_(expansion).eq_missing(expansion)
+    )
+
+    return frame.clone().join(sets, how="cross").filter(valid)
+
+
+def expansion_bits() -> pl.LazyFrame:
+    """Maps each Expansion to its bit in a UInt64 bitmask of Expansions."""
+    return pl.LazyFrame(
+        {"Expansion": range(64), "Bit": [1 << e for e in range(64)]},
+        schema={"Expansion": pl.UInt8, "Bit": pl.UInt64},
+    )
+
+
 def horizons(
     frame: pl.LazyFrame,
 ) -> pl.LazyFrame:
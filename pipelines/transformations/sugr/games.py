@@ -1,9 +1,15 @@
 """Provides operations on LazyFrames finalizing Spirit Island games."""
 
+import bisect
+import math
 import typing
 from dataclasses import dataclass
 
 import polars as pl
+import polars.selectors as cs
+
+from transformations.sugr.expansions import expansion_bits
+from transformations.sugr.spirits import ALL_SPIRITS, FIXED_POINT_TEAM
 
 
 def create_games(
@@ -11,20 +17,232 @@ def create_games(
     combos: pl.LazyFrame,
     *,
     use_expansion: bool = True,
+    scoring: "Scoring | None" = None,
 ) -> pl.LazyFrame:
     """Creates games from adversaries/spirits based on matchups."""
+    return score_games(
+        game_components(adversaries, combos, use_expansion=use_expansion),
+        scoring,
+    )
+
+
+def game_components(
+    adversaries: pl.LazyFrame,
+    combos: pl.LazyFrame,
+    *,
+    use_expansion: bool = True,
+) -> pl.LazyFrame:
+    """Creates games keeping the raw adversary and team scores for later scoring."""
     return (
         adversaries.clone()
         .cast({"Matchup": _all_matchups})
+        .rename(
+            {
+                "Difficulty": "Adversary Difficulty",
+                "Complexity": "Adversary Complexity",
+            },
+        )
         .join(
-            combos.clone().cast({"Matchup": _all_matchups}),
+            combos.clone()
+            .cast({"Matchup": _all_matchups})
+            .rename(
+                {
+                    "Difficulty": "Team Difficulty",
+                    "Complexity": "Team Complexity",
+                },
+            ),
             on=["Expansion", "Matchup"] if use_expansion else "Matchup",
         )
+        .drop("Matchup")
+    )
+
+
+def score_games(
+    components: pl.LazyFrame,
+    scoring: "Scoring | None" = None,
+) -> pl.LazyFrame:
+    """Replaces the raw adversary and team scores with the game's scores."""
+    scoring = scoring or Scoring()
+    return (
+        components.clone()
         .with_columns(
-            pl.col("Difficulty").mul(pl.col("Difficulty_right")),
-            pl.col("Complexity").mul(pl.lit(1.2)).add(pl.col("Complexity_right")),
+            scoring.difficulty().alias("Difficulty"),
+            scoring.complexity().alias("Complexity"),
+        )
+        .drop(
+            "Adversary Difficulty",
+            "Adversary Complexity",
+            "Team Difficulty",
+            "Team Complexity",
+        )
+    )
+
+
+@dataclass(frozen=True)
+class Scoring:
+    """Represents the parameters for scoring games from their raw components."""
+
+    complexity_weight: float = 1.2
+    very_high: int = 42
+    difficulty_quantiles: int = 5
+    complexity_quantiles: int = 5
+    # The teams were generated with fixed_point scores
+    fixed_point: bool = False
+
+    def difficulty(self) -> pl.Expr:
+        """The difficulty of the adversary scaled by the team."""
+        adversary = pl.col("Adversary Difficulty")
+        team = pl.col("Team Difficulty")
+        if self.fixed_point:
+            # In 1/6000ths like the team
+            return adversary.cast(pl.UInt32).mul(team.cast(pl.UInt32))
+
+        return adversary.mul(team)
+
+    def complexity(self) -> pl.Expr:
+        """The weighted complexity of the adversary plus the team."""
+        adversary = pl.col("Adversary Complexity")
+        team = pl.col("Team Complexity")
+        # Teams are in 1/60ths, the weight is in 1/100ths
+        scale = FIXED_POINT_TEAM if self.fixed_point else 1
+
+        if self.very_high != _very_high:
+            adversary = (
+                pl.when(adversary.eq(_very_high))
+                .then(pl.lit(self.very_high))
+                .otherwise(adversary)
+            )
+            # Non Very High spirits add up to at most 6 * 6 so the
+            # count of Very High spirits survives the team's mean.
+            total = team.cast(pl.Float64).mul(pl.col("Players")).truediv(scale)
+            team = (
+                total.round(0)
+                .mod(_very_high)
+                .add(total.round(0).floordiv(_very_high).mul(self.very_high))
+                .mul(scale)
+                .truediv(pl.col("Players"))
+            )
+
+        if self.fixed_point:
+            return (
+                adversary.cast(pl.UInt32)
+                .mul(pl.lit(round(self.complexity_weight * 100) * scale, pl.UInt32))
+                .add(team.round(0).cast(pl.UInt32).mul(pl.lit(100, pl.UInt32)))
+            )
+
+        return adversary.mul(pl.lit(self.complexity_weight)).add(team)
+
+
+def factorize_components(
+    adversaries: pl.LazyFrame,
+    combos: pl.LazyFrame,
+    *,
+    use_expansion: bool = True,
+) -> pl.LazyFrame:
+    """Counts the Games for each pair of distinct adversary and team scores."""
+    keys = ["Expansion", "Matchup"] if use_expansion else ["Matchup"]
+    team_keys = [
+        *keys,
+        *(["Players"] if "Players" in combos.collect_schema().names() else []),
+    ]
+
+    return (
+        adversaries.clone()
+        .select(
+            *keys,
+            pl.col("Difficulty").alias("Adversary Difficulty"),
+            pl.col("Complexity").alias("Adversary Complexity"),
+        )
+        .group_by(pl.all())
+        .agg(pl.len().cast(pl.UInt64).alias("Adversaries"))
+        .cast({"Matchup": _all_matchups})
+        .join(
+            combos.clone()
+            .select(
+                *team_keys,
+                pl.col("Difficulty").alias("Team Difficulty"),
+                pl.col("Complexity").alias("Team Complexity"),
+                "Has D",
+            )
+            .group_by(pl.all())
+            .agg(pl.len().cast(pl.UInt64).alias("Teams"))
+            .cast({"Matchup": _all_matchups}),
+            on=keys,
+        )
+        .with_columns(pl.col("Adversaries").mul(pl.col("Teams")).alias("Games"))
+        .drop("Adversaries", "Teams")
+    )
+
+
+def factorize_games(
+    adversaries: pl.LazyFrame,
+    combos: pl.LazyFrame,
+    *,
+    use_expansion: bool = True,
+    scoring: Scoring | None = None,
+) -> pl.LazyFrame:
+    """Scores each pair of distinct adversary and team scores instead of each game.
+
+    The result can be filtered by a Bucket into the compatible pairs
+    and then materialized into games with materialize_games. Each pair
+    counts the Games it stands for so je_buckets can weigh it.
+    """
+    return factorize_components(
+        adversaries,
+        combos,
+        use_expansion=use_expansion,
+    ).with_columns(
+        (scoring or Scoring()).difficulty().alias("Difficulty"),
+        (scoring or Scoring()).complexity().alias("Complexity"),
+    )
+
+
+def materialize_games(
+    pairs: pl.LazyFrame,
+    adversaries: pl.LazyFrame,
+    combos: pl.LazyFrame,
+    *,
+    use_expansion: bool = True,
+) -> pl.LazyFrame:
+    """Creates the games for the compatible pairs of adversary and team scores."""
+    keys = ["Expansion", "Matchup"] if use_expansion else ["Matchup"]
+    team_keys = [
+        *keys,
+        *(["Players"] if "Players" in combos.collect_schema().names() else []),
+    ]
+
+    return (
+        adversaries.clone()
+        .cast({"Matchup": _all_matchups})
+        .rename(
+            {
+                "Difficulty": "Adversary Difficulty",
+                "Complexity": "Adversary Complexity",
+            },
+        )
+        .join(
+            pairs.clone().drop("Difficulty", "Complexity", "Games"),
+            on=[*keys, "Adversary Difficulty", "Adversary Complexity"],
+        )
+        .join(
+            combos.clone()
+            .cast({"Matchup": _all_matchups})
+            .rename(
+                {
+                    "Difficulty": "Team Difficulty",
+                    "Complexity": "Team Complexity",
+                },
+            ),
+            on=[*team_keys, "Team Difficulty", "Team Complexity", "Has D"],
+        )
+        .drop(
+            "Matchup",
+            "Adversary Difficulty",
+            "Adversary Complexity",
+            "Team Difficulty",
+            "Team Complexity",
+            "Has D",
         )
-        .drop("Matchup", "Difficulty_right", "Complexity_right")
     )
 
 
@@ -49,28 +267,24 @@ def horizons_bucket() -> Bucket:
 def preje_buckets(
     all_games: pl.LazyFrame,
 ) -> list[Bucket]:
-    """Find difficulty/complexity ranges to bucket pre-jagged earth games into."""
+    """Find difficulty/complexity ranges to bucket pre-jagged earth games into.
+
+    The games can be factorized pairs, which are weighed by their Games.
+    """
     representative_games = all_games.clone().filter(
         pl.col("Expansion").eq(pl.lit(15)),
         pl.col("Players").gt(pl.lit(1)),
         pl.col("Players").le(pl.lit(3)),
     )
 
-    difficulty = (
+    difficulty = _qcut_breaks(
         representative_games.clone()
-        .with_columns(
-            pl.col("Difficulty")
-            .qcut(
-                3,
-                labels=[str(label) for label in range(3)],
-                include_breaks=True,
-            )
-            .alias("qcut"),
-        )
-        .unnest("qcut")
-        .select("breakpoint", "category")
-        .unique()
-    ).collect(streaming=True)
+        .group_by("Difficulty")
+        .agg(_weight(all_games).alias("Games"))
+        .collect(streaming=True),
+        "Difficulty",
+        3,
+    )
 
     def _buckets() -> typing.Iterator[Bucket]:
         d_min = -99
@@ -110,8 +324,17 @@ def preje_buckets(
 
 def je_buckets(
     all_games: pl.LazyFrame,
+    scoring: Scoring | None = None,
 ) -> list[Bucket]:
-    """Find difficulty/complexity ranges to bucket games into."""
+    """Find difficulty/complexity ranges to bucket games into.
+
+    The games can be factorized pairs, which are weighed by their Games.
+    """
+    scoring = scoring or Scoring()
+    (d_quantiles, c_quantiles) = (
+        scoring.difficulty_quantiles,
+        scoring.complexity_quantiles,
+    )
     representative_games = all_games.clone().filter(
         pl.col("Expansion").eq(pl.lit(63)),
         # Too many good games for D matchups.
@@ -119,48 +342,27 @@ def je_buckets(
         pl.col("Players").gt(pl.lit(1)),
         pl.col("Players").le(pl.lit(4)),
     )
-
     (difficulty, complexity) = pl.collect_all(
         [
             representative_games.clone()
-            .with_columns(
-                pl.col("Difficulty")
-                .qcut(
-                    5,
-                    labels=[str(label) for label in range(5)],
-                    include_breaks=True,
-                )
-                .alias("qcut"),
-            )
-            .unnest("qcut")
-            .select("breakpoint", "category")
-            .cast({"category": pl.UInt8})
-            .unique(),
+            .group_by("Difficulty")
+            .agg(_weight(all_games).alias("Games")),
             representative_games.clone()
-            .with_columns(
-                pl.col("Complexity")
-                .qcut(
-                    5,
-                    labels=[str(label) for label in range(5)],
-                    include_breaks=True,
-                )
-                .alias("qcut"),
-            )
-            .unnest("qcut")
-            .select("breakpoint", "category")
-            .cast({"category": pl.UInt8})
-            .unique(),
+            .group_by("Complexity")
+            .agg(_weight(all_games).alias("Games")),
         ],
         streaming=True,
     )
+    difficulty = _qcut_breaks(difficulty, "Difficulty", d_quantiles)
+    complexity = _qcut_breaks(complexity, "Complexity", c_quantiles)
 
     def _buckets() -> typing.Iterator[Bucket]:
         d_min = -99
         for d_max, d in difficulty.sort("category").rows():
             c_min = -99
             for c_max, c in complexity.sort("category").rows():
-                # Buckets are 0:0, 1:(1 + 2 + 3), 2:4
-                if c in [1, 2]:
+                # Buckets are 0:0, 1:(1 + 2 + 3), 2:4 for 5 quantiles
+                if 0 < c < c_quantiles - 2:
                     continue
 
                 yield Bucket(
@@ -173,7 +375,7 @@ def je_buckets(
                         pl.col("Complexity").le(c_max),
                     ),
                     d,
-                    c - 2 if c >= 3 else 0,
+                    c - (c_quantiles - 3) if c > 0 else 0,
                 )
                 c_min = c_max
             d_min = d_max
@@ -181,6 +383,80 @@ def je_buckets(
     return list(_buckets())
 
 
+def _weight(games: pl.LazyFrame) -> pl.Expr:
+    """The number of games in a group of games or factorized pairs."""
+    if "Games" in games.collect_schema().names():
+        return pl.col("Games").sum().cast(pl.UInt64)
+
+    return pl.len().cast(pl.UInt64)
+
+
+def _qcut_breaks(counts: pl.DataFrame, column: str, quantiles: int) -> pl.DataFrame:
+    """The breakpoint of each category qcut gives the values repeated Games times."""
+    schema = {"breakpoint": pl.Float64, "category": pl.UInt8}
+    if counts.is_empty():
+        return pl.DataFrame(schema=schema)
+
+    counts = counts.sort(column)
+    values = counts.get_column(column).cast(pl.Float64).to_list()
+    ends = counts.get_column("Games").cum_sum().to_list()
+
+    def _at(index: int) -> float:
+        return values[bisect.bisect_right(ends, index)]
+
+    # Linearly interpolated like Series.quantile
+    breaks = []
+    for q in range(1, quantiles):
+        position = (ends[-1] - 1) * (q / quantiles)
+        (lower, upper) = (_at(int(position)), _at(math.ceil(position)))
+        breaks.append(
+            lower
+            if lower == upper
+            else (position - int(position)) * (upper - lower) + lower,
+        )
+    if len(set(breaks)) < len(breaks):
+        msg = f"{column} quantiles have duplicate breaks: {breaks}"
+        raise pl.exceptions.DuplicateError(msg)
+    breaks.append(math.inf)
+
+    # Categories without values aren't in qcut's output
+    return pl.DataFrame(
+        [
+            (b, c)
+            for (c, b) in enumerate(breaks)
+            if any((breaks[c - 1] if c > 0 else -math.inf) < v <= b for v in values)
+        ],
+        schema=schema,
+        orient="row",
+    )
+
+
+def bucket_games(
+    components: pl.LazyFrame,
+    scoring: Scoring | None = None,
+) -> dict[int, list[Bucket]]:
+    """Find the buckets for each Expansion's games from their raw components.
+
+    The components can be counted with factorize_components instead.
+    """
+    games = score_games(components, scoring)
+    expansions = (
+        games.clone()
+        .select(pl.col("Expansion").unique())
+        .collect(streaming=True)
+        .get_column("Expansion")
+        .to_list()
+    )
+
+    # Same as the horizons/preje/jaggedearth expansions
+    preje = preje_buckets(games)
+    je = je_buckets(games, scoring)
+    return {
+        e: [horizons_bucket()] if e == 2 else preje if e < 17 else je
+        for e in expansions
+    }
+
+
 def filter_by_bucket(
     bucket: Bucket,
     all_games: pl.LazyFrame,
@@ -193,6 +469,141 @@ def filter_by_bucket(
     )
 
 
+def filter_components_by_bucket(
+    bucket: Bucket,
+    components: pl.LazyFrame,
+    expansion: int,
+    players: int,
+    scoring: Scoring | None = None,
+) -> pl.LazyFrame:
+    """Score and filter one Expansion/Players partition of the raw components."""
+    # Buckets can refer to the partition keys and the first 4 spirits
+    columns = _spirit_columns(components)
+    missing = [f"Spirit_{i}" for i in range(4) if f"Spirit_{i}" not in columns]
+    games = components.clone().with_columns(
+        pl.lit(expansion, pl.UInt8).alias("Expansion"),
+        pl.lit(players, pl.UInt8).alias("Players"),
+        *(pl.lit(None, pl.String).alias(c) for c in missing),
+    )
+    return filter_by_bucket(bucket, score_games(games, scoring)).drop(
+        "Expansion",
+        "Players",
+        *missing,
+    )
+
+
+def adversary_levels(adversaries: pl.LazyFrame) -> pl.LazyFrame:
+    """Numbers each distinct adversary/level/escalation for normalized games."""
+    return (
+        _with_adversary_levels(adversaries.clone())
+        .select(_adversary_level_columns)
+        .unique()
+        .sort(_adversary_level_columns, nulls_last=True)
+        .collect(streaming=True)
+        .with_row_index("Adversary Level")
+        .lazy()
+    )
+
+
+def game_teams(combinations: pl.LazyFrame) -> pl.LazyFrame:
+    """Identifies each distinct team of spirits for normalized games."""
+    spirits = _spirit_columns(combinations)
+    return combinations.clone().select(_team(spirits), *spirits).unique("Team")
+
+
+def normalize_games(games: pl.LazyFrame, levels: pl.LazyFrame) -> pl.LazyFrame:
+    """Replaces the adversary and spirit columns of the games with their ids.
+
+    Games valid for many Expansions are kept once with a bitmask of the Expansions.
+    """
+    spirits = _spirit_columns(games)
+    normalized = (
+        _with_adversary_levels(games.clone())
+        .with_columns(_team(spirits))
+        .join(
+            levels.clone(),
+            on=_adversary_level_columns,
+            how="left",
+            join_nulls=True,
+        )
+        .cast({"Expansion": pl.UInt8})
+        .join(expansion_bits(), on="Expansion")
+        .drop(*spirits, *_adversary_level_columns, "Expansion")
+    )
+
+    return (
+        normalized.group_by(cs.exclude("Bit"))
+        # Each expansion appears once per game so the sum is a bitwise or.
+        .agg(pl.sum("Bit").alias("Expansions"))
+        # group_by isn't supported by sink_parquet as of 1.2.1
+        .collect(streaming=True)
+        .lazy()
+    )
+
+
+def denormalize_games(
+    games: pl.LazyFrame,
+    teams: pl.LazyFrame,
+    levels: pl.LazyFrame,
+    expansion: int | None = None,
+) -> pl.LazyFrame:
+    """Views normalized games with their adversary and spirit columns.
+
+    When given an expansion the games are filtered to the ones valid for it.
+    """
+    if expansion is not None:
+        games = (
+            games.clone()
+            .filter(pl.col("Expansions").and_(pl.lit(1 << expansion, pl.UInt64)).ne(0))
+            .drop("Expansions")
+        )
+
+    return (
+        games.clone()
+        .join(levels.clone(), on="Adversary Level")
+        .join(teams.clone(), on="Team")
+        .drop("Adversary Level", "Team")
+    )
+
+
+def normalized_expansions(games: pl.LazyFrame) -> list[int]:
+    """Collects the Expansions with at least one normalized game."""
+    return (
+        games.clone()
+        .select(pl.col("Expansions").unique())
+        .join(expansion_bits(), how="cross")
+        .filter(pl.col("Expansions").and_(pl.col("Bit")).ne(0))
+        .select(pl.col("Expansion").unique().sort())
+        .collect(streaming=True)
+        .get_column("Expansion")
+        .to_list()
+    )
+
+
+def _spirit_columns(frame: pl.LazyFrame) -> list[str]:
+    return [c for c in frame.collect_schema().names() if c.startswith("Spirit_")]
+
+
+def _team(spirits: list[str]) -> pl.Expr:
+    bits = {s: 1 << i for (i, s) in enumerate(ALL_SPIRITS.categories.to_list())}
+    # Unknown spirits raise instead of colliding with another team
+    return pl.sum_horizontal(
+        pl.col(s).replace_strict(bits, return_dtype=pl.UInt64) for s in spirits
+    ).alias("Team")
+
+
+def _with_adversary_levels(frame: pl.LazyFrame) -> pl.LazyFrame:
+    if "Escalation" in frame.collect_schema().names():
+        return frame
+
+    return frame.with_columns(pl.lit(None, pl.String).alias("Escalation"))
+
+
+_adversary_level_columns = ["Adversary", "Level", "Escalation"]
+
+# The Complexity value of Very High spirits/adversaries
+_very_high = 42
+
 _all_matchups: pl.DataType = pl.Enum(
     [
         "Tier",
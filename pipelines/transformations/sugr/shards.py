@@ -0,0 +1,13 @@
+"""Provides operations for splitting skewed work into similarly sized shards."""
+
+
+def shard_ranges(rows: int, cost: int, max_cost: int) -> list[tuple[int, int]]:
+    """Splits the rows into (offset, length) ranges costing at most max_cost.
+
+    Args:
+        rows: Number of rows to split, i.e. combination ranks.
+        cost: Estimated cost of all the rows, i.e. games they make.
+        max_cost: Maximum estimated cost of a shard.
+    """
+    size = max(1, min(rows, rows * max_cost // max(cost, 1)))
+    return [(o, min(size, rows - o)) for o in range(0, rows, size)] or [(0, 0)]
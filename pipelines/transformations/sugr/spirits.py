@@ -1,14 +1,17 @@
 """Provides operations on LazyFrames related to spirits."""
 
+import typing
+
 import polars as pl
 import polars.selectors as cs
 
+from transformations.sugr.expansions import expansion_bits
+
 
-def spirits_by_expansions(expansions: int, spirits: pl.LazyFrame) -> pl.LazyFrame:
-    """Filter, and clean Spirit data."""
+def spirits_by_expansions(spirits: pl.LazyFrame) -> pl.LazyFrame:
+    """Clean Spirit data already sliced to a set of expansions."""
     return (
         spirits.clone()
-        .filter(pl.col("Expansion").or_(expansions).eq_missing(expansions))
         .join(
             pl.LazyFrame(
                 {
@@ -33,45 +36,56 @@ def spirits_by_expansions(expansions: int, spirits: pl.LazyFrame) -> pl.LazyFram
 
 def calculate_matchups(matchup: str, spirits: pl.LazyFrame) -> pl.LazyFrame:
     """Calculate the difficulty modifiers and best/worst spirits for the matchup."""
-    if matchup == "Tier":
-        matchup_values = pl.LazyFrame(
-            {
-                "Tier": ["X", "S", "A", "B", "C", "D", "F"],
-                "Difficulty": [0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3],
-                "Has D": [False] * 7,
-            },
-            schema={
-                "Tier": pl.Utf8,
-                "Difficulty": pl.Float32,
-                "Has D": pl.Boolean,
-            },
-        )
-    else:
-        matchup_values = pl.LazyFrame(
-            {
-                matchup: ["S", "A", "B", "C", "D"],
-                "Difficulty": [0.8, 0.9, 1.0, 1.15, 1.3],
-                "Has D": [False, False, False, False, True],
-            },
-            schema={
-                matchup: pl.Utf8,
-                "Difficulty": pl.Float32,
-                "Has D": pl.Boolean,
-            },
-        )
+    return calculate_all_matchups([matchup], spirits).drop("Matchup")
+
+
+def calculate_all_matchups(
+    matchups: list[str],
+    spirits: pl.LazyFrame,
+) -> pl.LazyFrame:
+    """Calculate the difficulty modifiers and best/worst spirits for every matchup.
+
+    The rating columns are unpivoted once and joined against a single
+    rating lookup for every matchup, the result has a Matchup column.
+    """
+    matchup_values = pl.concat(
+        [
+            pl.LazyFrame(
+                {
+                    "Matchup": [m] * 7,
+                    "Rating": ["X", "S", "A", "B", "C", "D", "F"],
+                    "Difficulty": [0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3],
+                    "Has D": [False] * 7,
+                },
+                schema=_matchup_values_schema,
+            )
+            if m == "Tier"
+            else pl.LazyFrame(
+                {
+                    "Matchup": [m] * 5,
+                    "Rating": ["S", "A", "B", "C", "D"],
+                    "Difficulty": [0.8, 0.9, 1.0, 1.15, 1.3],
+                    "Has D": [False, False, False, False, True],
+                },
+                schema=_matchup_values_schema,
+            )
+            for m in matchups
+        ],
+    )
 
     return (
-        (
-            spirits.clone()
-            .join(matchup_values, on=matchup)
-            .group_by(["Spirit", "Difficulty"])
-            .agg(pl.min("Complexity"), pl.all("Has D"))
-            .sort("Spirit", "Difficulty")
-            .unique("Spirit", keep="first")
+        spirits.clone()
+        .unpivot(
+            matchups,
+            index=["Spirit", "Complexity"],
+            variable_name="Matchup",
+            value_name="Rating",
         )
-        # something isn't support by sink_parquet as of 1.2.1
-        .collect(streaming=True)
-        .lazy()
+        .join(matchup_values, on=["Matchup", "Rating"])
+        .group_by(["Matchup", "Spirit", "Difficulty"])
+        .agg(pl.min("Complexity"), pl.all("Has D"))
+        .sort("Matchup", "Spirit", "Difficulty")
+        .unique(["Matchup", "Spirit"], keep="first")
     )
 
 
@@ -79,17 +93,31 @@ def generate_combinations(
     players: int,
     matchups: pl.LazyFrame,
     combos: pl.LazyFrame,
+    *,
+    fixed_point: bool = False,
 ) -> pl.LazyFrame:
-    """Filters and calculates complexity/difficulty for combinations of spirits."""
+    """Filters and calculates complexity/difficulty for combinations of spirits.
+
+    With fixed_point the team's scores are exact integers, see fixed_point_scores.
+    """
     if players == 1:
+        if fixed_point:
+            return (
+                _fixed_point_spirits(matchups.clone())
+                .with_columns(*fixed_point_scores(players))
+                .rename({"Spirit": "Spirit_0"})
+            )
+
         return (
             matchups.clone()
             .with_columns(pl.col("Complexity").cast(pl.Float32))
             .rename({"Spirit": "Spirit_0"})
         )
 
-    combos = combos.clone().cast({f"Spirit_{p}": _all_spirits for p in range(players)})
-    matchups = matchups.clone().cast({"Spirit": _all_spirits})
+    combos = combos.clone().cast({f"Spirit_{p}": ALL_SPIRITS for p in range(players)})
+    matchups = matchups.clone().cast({"Spirit": ALL_SPIRITS})
+    if fixed_point:
+        matchups = _fixed_point_spirits(matchups)
     for p in range(players):
         combos = combos.clone().join(
             matchups,
@@ -99,30 +127,180 @@ def generate_combinations(
         )
 
     return (
-        (
-            combos.clone()
-            .with_columns(
-                pl.mean_horizontal(cs.starts_with("Difficulty")).alias("Difficulty"),
-                pl.mean_horizontal(cs.starts_with("Complexity")).alias("Complexity"),
-                pl.sum_horizontal(cs.starts_with("Has D"))
-                .cast(pl.Boolean)
-                .alias("Has D"),
+        combos.clone()
+        .with_columns(
+            *fixed_point_scores(
+                players,
+                pl.sum_horizontal(cs.starts_with("Difficulty")),
+                pl.sum_horizontal(cs.starts_with("Complexity")),
             )
-            .cast({f"Spirit_{p}": pl.String for p in range(players)})
-            .select(
-                [
-                    *[f"Spirit_{p}" for p in range(players)],
+            if fixed_point
+            else [
+                pl.mean_horizontal(cs.starts_with("Difficulty")).alias(
                     "Difficulty",
+                ),
+                pl.mean_horizontal(cs.starts_with("Complexity")).alias(
                     "Complexity",
-                    "Has D",
-                ],
-            )
+                ),
+            ],
+            pl.sum_horizontal(cs.starts_with("Has D")).cast(pl.Boolean).alias("Has D"),
+        )
+        .cast({f"Spirit_{p}": pl.String for p in range(players)})
+        .select(
+            [
+                *[f"Spirit_{p}" for p in range(players)],
+                "Difficulty",
+                "Complexity",
+                "Has D",
+            ],
+        )
+    )
+
+
+def generate_all_combinations(
+    max_players: int,
+    matchups: pl.LazyFrame,
+    *,
+    fixed_point: bool = False,
+) -> typing.Iterator[tuple[int, pl.LazyFrame]]:
+    """Calculates complexity/difficulty for combinations of 1..max_players spirits.
+
+    Each k-player team extends a (k-1)-player team with a later spirit
+    (in Enum order) so the sums are only calculated once across player counts.
+    """
+    yield from _extend_teams(max_players, matchups.clone(), fixed_point=fixed_point)
+
+
+def generate_lattice_combinations(
+    max_players: int,
+    matchups: pl.LazyFrame,
+    *,
+    fixed_point: bool = False,
+) -> typing.Iterator[tuple[int, pl.LazyFrame]]:
+    """Calculates complexity/difficulty for combinations across every expansion.
+
+    Matchups for every expansion are reduced to the distinct spirit scores with
+    a bitmask of the Expansions they apply to. Teams are only scored once and
+    are valid for the intersection of their spirits' Expansions.
+    """
+    yield from _extend_teams(
+        max_players,
+        matchups.clone()
+        .cast({"Expansion": pl.UInt8})
+        .join(expansion_bits(), on="Expansion")
+        .group_by("Spirit", "Difficulty", "Complexity", "Has D")
+        # Each expansion appears once per spirit so the sum is a bitwise or.
+        .agg(pl.sum("Bit").alias("Expansions")),
+        fixed_point=fixed_point,
+    )
+
+
+def fixed_point_scores(
+    players: int,
+    difficulty: pl.Expr | None = None,
+    complexity: pl.Expr | None = None,
+) -> list[pl.Expr]:
+    """Scales the sums of a team's fixed-point scores to exact integer means.
+
+    Spirit difficulties are summed in hundredths and complexities as is.
+    Every team size divides 60 so the means are integers in 1/6000ths
+    (Difficulty) and 1/60ths (Complexity), which fit into UInt16.
+    """
+    return [
+        (difficulty if difficulty is not None else pl.col("Difficulty"))
+        .cast(pl.UInt16)
+        .mul(pl.lit(FIXED_POINT_TEAM // players, pl.UInt16))
+        .alias("Difficulty"),
+        (complexity if complexity is not None else pl.col("Complexity"))
+        .cast(pl.UInt16)
+        .mul(pl.lit(FIXED_POINT_TEAM // players, pl.UInt16))
+        .alias("Complexity"),
+    ]
+
+
+def combinations_for_expansion(
+    expansion: int,
+    combinations: pl.LazyFrame,
+) -> pl.LazyFrame:
+    """Filters lattice combinations to the ones valid for the expansion."""
+    return (
+        combinations.clone()
+        .filter(pl.col("Expansions").and_(pl.lit(1 << expansion, pl.UInt64)).ne(0))
+        .drop("Expansions")
+    )
+
+
+def _extend_teams(
+    max_players: int,
+    matchups: pl.LazyFrame,
+    *,
+    fixed_point: bool = False,
+) -> typing.Iterator[tuple[int, pl.LazyFrame]]:
+    lattice = "Expansions" in matchups.collect_schema().names()
+    if fixed_point:
+        matchups = _fixed_point_spirits(matchups)
+    score_type = pl.UInt16 if fixed_point else pl.Float64
+    spirits = (
+        matchups.cast({"Spirit": ALL_SPIRITS})
+        .select(
+            pl.col("Spirit"),
+            pl.col("Spirit").to_physical().alias("Index"),
+            pl.col("Difficulty").cast(score_type),
+            pl.col("Complexity").cast(score_type),
+            pl.col("Has D"),
+            *([pl.col("Expansions")] if lattice else []),
         )
-        # horizontal isn't support by sink_parquet as of 1.2.1
         .collect(streaming=True)
         .lazy()
     )
 
+    teams = spirits.clone().rename({"Spirit": "Spirit_0"})
+    for players in range(1, max_players + 1):
+        if players > 1:
+            teams = teams.join(spirits.clone(), how="cross").filter(
+                pl.col("Index_right").gt(pl.col("Index")),
+            )
+            if lattice:
+                teams = teams.with_columns(
+                    pl.col("Expansions").and_(pl.col("Expansions_right")),
+                ).filter(pl.col("Expansions").ne(0))
+
+            teams = (
+                teams.select(
+                    *[f"Spirit_{p}" for p in range(players - 1)],
+                    pl.col("Spirit").alias(f"Spirit_{players - 1}"),
+                    pl.col("Index_right").alias("Index"),
+                    pl.col("Difficulty").add(pl.col("Difficulty_right")),
+                    pl.col("Complexity").add(pl.col("Complexity_right")),
+                    pl.col("Has D").or_(pl.col("Has D_right")),
+                    *([pl.col("Expansions")] if lattice else []),
+                )
+                .collect(streaming=True)
+                .lazy()
+            )
+
+        yield (
+            players,
+            teams.clone().select(
+                *[pl.col(f"Spirit_{p}").cast(pl.String) for p in range(players)],
+                *fixed_point_scores(players)
+                if fixed_point
+                else [
+                    pl.col("Difficulty").truediv(players),
+                    pl.col("Complexity").truediv(players),
+                ],
+                pl.col("Has D"),
+                *([pl.col("Expansions")] if lattice else []),
+            ),
+        )
+
+
+def _fixed_point_spirits(matchups: pl.LazyFrame) -> pl.LazyFrame:
+    return matchups.with_columns(
+        pl.col("Difficulty").mul(100).round(0).cast(pl.UInt16),
+        pl.col("Complexity").cast(pl.UInt16),
+    )
+
 
 def _write_combinations(output: str) -> None:
     import csv
@@ -136,7 +314,7 @@ def _write_combinations(output: str) -> None:
             writer = csv.writer(combos_file)
             writer.writerow([f"Spirit_{p}" for p in range(i)])
 
-            for c in combinations(_all_spirits.categories.to_list(), i):
+            for c in combinations(ALL_SPIRITS.categories.to_list(), i):
                 writer.writerow(c)
 
         combos_parquet = Path(output, f"{i}.parquet")
@@ -146,7 +324,19 @@ def _write_combinations(output: str) -> None:
         combos_csv.unlink(missing_ok=True)
 
 
-_all_spirits = pl.Enum(
+# Every team size from 1 to 6 divides this
+FIXED_POINT_TEAM = 60
+
+_matchup_values_schema = {
+    "Matchup": pl.String,
+    "Rating": pl.String,
+    "Difficulty": pl.Float32,
+    "Has D": pl.Boolean,
+}
+
+
+# Every spirit, in the order of the input combinations
+ALL_SPIRITS = pl.Enum(
     [
         "Lightning's Swift Strike",
         "River Surges in Sunlight",